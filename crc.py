@@ -14,9 +14,46 @@
     See the License for the specific language governing permissions and
     limitations under the License.
 """
+import argparse
+import mmap
 import os
-import shutil
-from crc_calc import CRC_CALC
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from crc_calc import CRC_CALC, crc_nibble_table, crc_tables, reflect, table_parameters, write_table_store
+from crc_native import load_native
+
+
+# Default size of the chunks a file is split into by CRC.file()
+FILE_CHUNK_SIZE = 64 << 20
+
+# Chunks are never made smaller than this, even if there are more workers
+FILE_CHUNK_MIN = 1 << 20
+
+# Table engines of the generated C code: (slice_by, table_bits)
+C_ENGINES = {
+    "bytewise": (1, 8),
+    "slice4": (4, 8),
+    "slice8": (8, 8),
+    "nibble": (1, 4),
+}
+
+# Template files of the generated C code, relative to template/c
+C_TEMPLATES = (
+    "crc/crc.default",
+    "crc/crc.h",
+    "crc/crc.c",
+    "crc/crc.accel",
+    "crc/CMakeLists.txt",
+    "test/test.c",
+    "test/CMakeLists.txt",
+    "CMakeLists.txt",
+    "toolchain.cmake",
+    "libcrc.cmake",
+)
+
+# Number of bytes the command line tool reads at once
+CLI_CHUNK_SIZE = 1 << 20
 
 
 """Known CRC algorihtms table
@@ -31,6 +68,26 @@ from crc_calc import CRC_CALC
         result_reflected (bool): True, if the result should be reflected before the final XOR is applied
 """
 crc_alg_table = {
+    # CRC3
+    "crc3_gsm": (3, 0x3, 0x0, 0x7, False, False),
+    "crc3_rohc": (3, 0x3, 0x7, 0x0, True, True),
+    # CRC4
+    "crc4_g_704": (4, 0x3, 0x0, 0x0, True, True),
+    "crc4_interlaken": (4, 0x3, 0xf, 0xf, False, False),
+    # CRC5
+    "crc5_epc_c1g2": (5, 0x09, 0x09, 0x00, False, False),
+    "crc5_g_704": (5, 0x15, 0x00, 0x00, True, True),
+    "crc5_usb": (5, 0x05, 0x1f, 0x1f, True, True),
+    # CRC6
+    "crc6_cdma2000_a": (6, 0x27, 0x3f, 0x00, False, False),
+    "crc6_cdma2000_b": (6, 0x07, 0x3f, 0x00, False, False),
+    "crc6_darc": (6, 0x19, 0x00, 0x00, True, True),
+    "crc6_g_704": (6, 0x03, 0x00, 0x00, True, True),
+    "crc6_gsm": (6, 0x2f, 0x00, 0x3f, False, False),
+    # CRC7
+    "crc7_mmc": (7, 0x09, 0x00, 0x00, False, False),
+    "crc7_rohc": (7, 0x4f, 0x7f, 0x00, True, True),
+    "crc7_umts": (7, 0x45, 0x00, 0x00, False, False),
     # CRC8
     "crc8": (8, 0x07, 0x00, 0x00, False, False),
     "crc8_sae_j1850": (8, 0x1d, 0xff, 0xff, False, False),
@@ -45,6 +102,26 @@ crc_alg_table = {
     "crc8_maxim": (8, 0x31, 0x00, 0x00, True, True),
     "crc8_rohc": (8, 0x07, 0xff, 0x00, True, True),
     "crc8_wcdma": (8, 0x9b, 0x00, 0x00, True, True),
+    # CRC10
+    "crc10_atm": (10, 0x233, 0x000, 0x000, False, False),
+    "crc10_cdma2000": (10, 0x3d9, 0x3ff, 0x000, False, False),
+    "crc10_gsm": (10, 0x175, 0x000, 0x3ff, False, False),
+    # CRC11
+    "crc11_flexray": (11, 0x385, 0x01a, 0x000, False, False),
+    "crc11_umts": (11, 0x307, 0x000, 0x000, False, False),
+    # CRC12
+    "crc12_cdma2000": (12, 0xf13, 0xfff, 0x000, False, False),
+    "crc12_dect": (12, 0x80f, 0x000, 0x000, False, False),
+    "crc12_gsm": (12, 0xd31, 0x000, 0xfff, False, False),
+    "crc12_umts": (12, 0x80f, 0x000, 0x000, False, True),
+    # CRC13
+    "crc13_bbc": (13, 0x1cf5, 0x0000, 0x0000, False, False),
+    # CRC14
+    "crc14_darc": (14, 0x0805, 0x0000, 0x0000, True, True),
+    "crc14_gsm": (14, 0x202d, 0x0000, 0x3fff, False, False),
+    # CRC15
+    "crc15_can": (15, 0x4599, 0x0000, 0x0000, False, False),
+    "crc15_mpt1327": (15, 0x6815, 0x0000, 0x0001, False, False),
     # CRC16
     "crc16_ccit_zero": (16, 0x1021, 0x0000, 0x0000, False, False),
     "crc16_arc": (16, 0x8005, 0x0000, 0x0000, True, True),
@@ -71,10 +148,18 @@ crc_alg_table = {
     "crc16_modbus": (16, 0x8005, 0xffff, 0x0000, True, True),
     "crc16_x25": (16, 0x1021, 0xffff, 0xffff, True, True),
     "crc16_xmodem": (16, 0x1021, 0x0000, 0x0000, False, False),
+    # CRC17
+    "crc17_can_fd": (17, 0x1685b, 0x00000, 0x00000, False, False),
+    # CRC21
+    "crc21_can_fd": (21, 0x102899, 0x000000, 0x000000, False, False),
     # CRC24
     "crc24_openpgp": (24, 0x864cfb, 0xb704ce, 0x000000, False, False),
     "crc24_flexray_a": (24, 0x5d6dcb, 0xfedcba, 0x000000, False, False),
     "crc24_flexray_b": (24, 0x5d6dcb, 0xabcdef, 0x000000, False, False),
+    # CRC30
+    "crc30_cdma": (30, 0x2030b9c7, 0x3fffffff, 0x3fffffff, False, False),
+    # CRC31
+    "crc31_philips": (31, 0x04c11db7, 0x7fffffff, 0x7fffffff, False, False),
     # CRC32
     "crc32": (32, 0x04c11db7, 0xffffffff, 0xffffffff, True, True),
     "crc32_bzip2": (32, 0x04c11db7, 0xffffffff, 0xffffffff, False, False),
@@ -94,11 +179,21 @@ crc_alg_table = {
 
 
 class CRC(CRC_CALC):
-    def __init__(self, alg_name):
+    """Known CRC model from :data:`crc_alg_table`.
+    Args:
+        alg_name (str): Name of the model
+        slice_by (int): Table engine, see :class:`crc_calc.CRC_CALC`
+        native (bool): Run the table engine in a shared library built from the
+            generated C code, see :mod:`crc_native`. Falls back to pure Python
+            silently if it cannot be built, :attr:`native` tells which one is
+            used.
+    """
+
+    def __init__(self, alg_name, slice_by=1, native=False):
         if not alg_name in crc_alg_table.keys():
             raise ValueError("Unknown CRC algorihtm")
         else:
-            super().__init__(*crc_alg_table[alg_name])
+            super().__init__(*crc_alg_table[alg_name], slice_by=slice_by)
             self._algorithm = alg_name
             if self._width <= 8:
                 self._data_width = 8
@@ -110,116 +205,708 @@ class CRC(CRC_CALC):
                 self._data_width = 64
             else:
                 raise ValueError("CRC parameter error")
+            self.__native = None
+            if native:
+                self.__native = load_native(self)
+                # Building the library may have run the Python engine already
+                self._engine = None
 
-    def __check_path(self, path):
-        if not os.path.exists(path):
-            os.makedirs(path, mode=0o755, exist_ok=True)
-
-    def generate_for_c(self, path="./generate/c/"):
-        script_path = os.path.realpath(__file__)
-        template_path = os.path.dirname(script_path) + "/template/c"
-        crc_path = path + "libcrc/{alg_name}/crc/".format(alg_name=self._algorithm)
-
-        crc_table = str(self)
-
-        with open(template_path + "/crc/crc.default", "r") as f_obj:
-            crc_default = f_obj.read().format(
-                display_width=self._width // 4,
-                width=self._width,
-                input_reflected=self._input_reflected,
-                result_reflected=self._result_reflected,
-                polynomial=self._polynomial,
-                initial_value=self._initial_value,
-                final_xor_value=self._final_xor_value,
-                cast_mask=self._cast_mask,
-            )
+    def __getstate__(self):
+        # The native backend holds a loaded library, only whether it is used
+        # is pickled
+        state = super().__getstate__()
+        state['_CRC__native'] = self.__native is not None
+        return state
 
-        with open(template_path + "/crc/crc.h", "r") as f_obj:
-            crc_h = f_obj.read().format(
-                algorithm=self._algorithm,
-                algorithm_upper=self._algorithm.upper(),
-                display_width=self._width // 4,
-                data_width=self._data_width,
-                width=self._width,
-            )
+    def __setstate__(self, state):
+        native = state.pop('_CRC__native')
+        super().__setstate__(state)
+        self.__native = load_native(self) if native else None
+        self._engine = None
 
-        with open(template_path + "/crc/crc.c", "r") as f_obj:
-            crc_c = f_obj.read().format(
-                algorithm=self._algorithm,
-                algorithm_upper=self._algorithm.upper(),
-            )
+    @property
+    def native(self):
+        """True, if the checksums are computed by the native backend."""
+        return self.__native is not None
 
-        with open(template_path + "/crc/CMakeLists.txt", "r") as f_obj:
-            crc_cmake = f_obj.read().format(
-                algorithm=self._algorithm,
+    def _compile_engine(self):
+        if self.__native is not None:
+            return self.__native.update
+
+        return super()._compile_engine()
+
+    def _engine_name(self):
+        if self.__native is not None:
+            return 'native'
+
+        return super()._engine_name()
+
+    def _profile_name(self):
+        return self._algorithm
+
+    def file(self, path, workers=None, chunk_size=FILE_CHUNK_SIZE):
+        """Compute the CRC checksum of a file. The file is memory mapped and
+        split into chunks that are checksummed in parallel by a process pool,
+        the partial checksums are merged with :meth:`combine`. The result is
+        identical to checksumming the whole content at once.
+        Args:
+            path (str): File that should be checked
+            workers (int): Number of worker processes, defaults to the number
+                of CPUs. ``1`` checksums the file in the calling process.
+            chunk_size (int): Maximum number of bytes per chunk
+        Returns:
+            int - CRC checksum
+        """
+        size = os.path.getsize(path)
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        # Use at least one chunk per worker to keep all of them busy
+        chunk_size = max(FILE_CHUNK_MIN, min(chunk_size, -(-size // workers)))
+        chunks = [(offset, min(chunk_size, size - offset))
+                  for offset in range(0, size, chunk_size)]
+
+        if workers <= 1 or len(chunks) <= 1:
+            return _file_chunk_crc(self, path, 0, size)
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            results = executor.map(
+                _file_chunk_crc,
+                [self] * len(chunks),
+                [path] * len(chunks),
+                [offset for offset, _ in chunks],
+                [length for _, length in chunks],
             )
 
-        with open(template_path + "/test/test.c", "r") as f_obj:
-            crc_test = f_obj.read().format(
+            crc = None
+            for (_, length), chunk_crc in zip(chunks, results):
+                if crc is None:
+                    crc = chunk_crc
+                else:
+                    crc = self.combine(crc, chunk_crc, length)
+
+        return crc
+
+    def __format_table(self, table, width):
+        rows = [table[i:i+8] for i in range(0, len(table), 8)]
+        return ',\n'.join([', '.join(
+            ["0x{:0{}X}".format(i, (width + 3) // 4) for i in row]
+        ) for row in rows]) + ','
+
+    def _render_c(self, engine="bytewise", accel=False, templates=None):
+        """Render the C implementation of the model without writing it, see
+        :meth:`generate_for_c`.
+        Args:
+            engine (str): Table engine, one of :data:`C_ENGINES`
+            accel (bool): Include the hardware accelerated update
+            templates (dict): Templates returned by :func:`load_c_templates`,
+                read from disk if not given
+        Returns:
+            dict - File contents by path relative to the output directory
+        """
+        if engine not in C_ENGINES:
+            raise ValueError("Unknown C engine: {}".format(engine))
+        slice_by, table_bits = C_ENGINES[engine]
+
+        if templates is None:
+            templates = load_c_templates()
+        crc_path = "libcrc/{alg_name}/crc/".format(alg_name=self._algorithm)
+
+        # The C code keeps the register reflected whenever the input is
+        # reflected, so that neither input bytes nor the table need to be
+        # reflected at runtime. Only the result may need one reflection.
+        # A non-reflected register is left-aligned to whole bytes, so that
+        # the byte oriented engines work for any width.
+        reflected = self._input_reflected
+        final_reflect = self._input_reflected != self._result_reflected
+        register_width, register_polynomial = table_parameters(self._width, self._polynomial, reflected)
+        align = register_width - self._width
+        if self._input_reflected and not self._result_reflected:
+            init_register = reflect(self._initial_value, self._width)
+        else:
+            init_register = self._initial_value << align
+
+        if table_bits == 4:
+            crc_table = self.__format_table(
+                crc_nibble_table(register_width, register_polynomial, reflected), register_width)
+        elif slice_by > 1:
+            crc_table = '\n'.join(['{{\n{}\n}},'.format(self.__format_table(table, register_width))
+                                   for table in crc_tables(register_width, register_polynomial, reflected, slice_by)])
+        else:
+            crc_table = self.__format_table(
+                crc_tables(register_width, register_polynomial, reflected)[0], register_width)
+
+        # Folding constants for PCLMULQDQ: a 16 byte block X followed by 16
+        # more bytes is replaced by X * x^128 mod P, computed per 64 bit lane.
+        # The reflected carry-less product is one bit short, hence x^191 and
+        # x^127 in the reflected case.
+        crc32c = (self._width == 32 and self._polynomial == 0x1EDC6F41
+                  and self._input_reflected)
+        if reflected:
+            fold_high = reflect(self._xnmodp(127), 64)
+            fold_low = reflect(self._xnmodp(191), 64)
+        else:
+            fold_high = self._xnmodp(192)
+            fold_low = self._xnmodp(128)
+        if not accel:
+            accel_backend = "none"
+        elif crc32c:
+            accel_backend = "sse4.2, pclmul"
+        else:
+            accel_backend = "pclmul"
+
+        files = {}
+
+        files[crc_path + "{alg_name}.table".format(alg_name=self._algorithm)] = crc_table
+
+        files[crc_path + "{alg_name}.default".format(alg_name=self._algorithm)] = templates["crc/crc.default"].format(
+            display_width=(self._width + 3) // 4,
+            width=self._width,
+            input_reflected=self._input_reflected,
+            result_reflected=self._result_reflected,
+            polynomial=self._polynomial,
+            initial_value=self._initial_value,
+            final_xor_value=self._final_xor_value,
+            init_register=init_register,
+            cast_mask=self._cast_mask,
+        )
+
+        files[crc_path + "{alg_name}.h".format(alg_name=self._algorithm)] = templates["crc/crc.h"].format(
+            algorithm=self._algorithm,
+            algorithm_upper=self._algorithm.upper(),
+            display_width=(self._width + 3) // 4,
+            data_width=self._data_width,
+            width=self._width,
+            register_width=register_width,
+            align=align,
+            register_mask=(1 << register_width) - 1,
+            engine=engine,
+            reflected=reflected,
+            final_reflect=final_reflect,
+            init_register=init_register,
+            final_xor_value=self._final_xor_value,
+            slice_by=slice_by,
+            table_bits=table_bits,
+            accel=accel,
+            accel_backend=accel_backend,
+        )
+
+        files[crc_path + "{alg_name}.c".format(alg_name=self._algorithm)] = templates["crc/crc.c"].format(
+            algorithm=self._algorithm,
+            algorithm_upper=self._algorithm.upper(),
+        )
+
+        if accel:
+            files[crc_path + "{alg_name}.accel".format(alg_name=self._algorithm)] = templates["crc/crc.accel"].format(
                 algorithm=self._algorithm,
                 algorithm_upper=self._algorithm.upper(),
+                backend=accel_backend,
+                crc32c=crc32c,
+                fold_high=fold_high,
+                fold_low=fold_low,
             )
 
-        with open(template_path + "/test/CMakeLists.txt", "r") as f_obj:
-            crc_test_cmake = f_obj.read().format(
-                algorithm=self._algorithm,
-            )
+        files[crc_path + "CMakeLists.txt"] = templates["crc/CMakeLists.txt"].format(
+            algorithm=self._algorithm,
+        )
+
+        files["libcrc/{alg_name}/test_{alg_name}.c".format(alg_name=self._algorithm)] = templates["test/test.c"].format(
+            algorithm=self._algorithm,
+            algorithm_upper=self._algorithm.upper(),
+            display_width=(self._width + 3) // 4,
+            check=self(b"123456789"),
+        )
+
+        files["libcrc/{alg_name}/CMakeLists.txt".format(alg_name=self._algorithm)] = templates["test/CMakeLists.txt"].format(
+            algorithm=self._algorithm,
+        )
+
+        return files
+
+    def generate_for_c(self, path="./generate/c/", engine="bytewise", accel=False):
+        """Generate a C implementation of the model. The model parameters
+        become compile time constants of the generated code. Files whose
+        content did not change are not rewritten, so that the build system
+        does not rebuild them. Use :func:`generate_c` for many models.
+        Args:
+            path (str): Output directory
+            engine (str): Table engine, one of :data:`C_ENGINES`. ``bytewise``
+                uses one 256 entry table, ``slice4``/``slice8`` use 4/8 tables
+                and consume 4/8 bytes per step, ``nibble`` uses a 16 entry
+                table for targets with very little flash.
+            accel (bool): Also emit an x86-64 hardware accelerated update
+                (SSE4.2 ``crc32`` for CRC-32C, PCLMULQDQ folding for every
+                other model), selected at runtime with CPUID. The table
+                engine stays the fallback.
+        Returns:
+            list of str - Files that were written
+        """
+        templates = load_c_templates()
+        files = self._render_c(engine, accel, templates)
+        files.update(_c_shared_files(templates))
+
+        return _write_c_files(path, files)
+
+
+def load_c_templates():
+    """Read the C templates, see :data:`C_TEMPLATES`.
+    Returns:
+        dict - Template text by path relative to ``template/c``
+    """
+    template_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "template", "c")
+    templates = {}
+
+    for name in C_TEMPLATES:
+        with open(os.path.join(template_path, name), "r") as f_obj:
+            templates[name] = f_obj.read()
+
+    return templates
+
+
+def _c_shared_files(templates):
+    """Files of the generated C project that do not depend on the models."""
+    return {
+        "CMakeLists.txt": templates["CMakeLists.txt"],
+        "toolchain.cmake": templates["toolchain.cmake"],
+        "libcrc/libcrc.cmake": templates["libcrc.cmake"],
+    }
+
+
+def _write_if_changed(path, content):
+    """Write a text file unless it already has exactly this content.
+    Returns:
+        bool - True, if the file was written
+    """
+    try:
+        with open(path, "r") as f_obj:
+            if f_obj.read() == content:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+
+    os.makedirs(os.path.dirname(path) or ".", mode=0o755, exist_ok=True)
+    with open(path, "w") as f_obj:
+        f_obj.write(content)
+
+    return True
+
+
+def _write_c_files(path, files):
+    return [os.path.join(path, name) for name, content in sorted(files.items())
+            if _write_if_changed(os.path.join(path, name), content)]
+
+
+def _render_c_model(alg_name, parameters, engine, accel, templates):
+    """Render one model for :func:`generate_c`. Runs in the worker processes,
+    which is why it is a module level function.
+    """
+    # Workers started with spawn do not see models added at runtime
+    crc_alg_table[alg_name] = parameters
 
-        self.__check_path(crc_path)
-        shutil.copyfile(template_path + "/CMakeLists.txt",
-                        path + "CMakeLists.txt")
-        shutil.copyfile(template_path + "/toolchain.cmake",
-                        path + "toolchain.cmake")
-        shutil.copyfile(template_path + "/libcrc.cmake",
-                        path + "libcrc/libcrc.cmake")
+    return CRC(alg_name)._render_c(engine, accel, templates)
+
+
+def _render_c_combined(alg_names, files, engine):
+    """Render ``libcrc/libcrc.c`` and ``libcrc/libcrc.h``: all models in one
+    translation unit, each distinct lookup table is defined only once and
+    shared by all models using it.
+    Returns:
+        dict - File contents by path relative to the output directory
+    """
+    slice_by, table_bits = C_ENGINES[engine]
+    if table_bits == 4:
+        dimensions, entries = "[16]", 16
+    elif slice_by > 1:
+        dimensions, entries = "[{}][256]".format(slice_by), slice_by * 256
+    else:
+        dimensions, entries = "[256]", 256
+
+    header = ["#ifndef __LIBCRC_H__", "#define __LIBCRC_H__", ""]
+    tables = []
+    models = []
+    shared = {}
+    table_bytes = 0
+    saved_bytes = 0
+
+    # Tables are interned by their rendered content, which only depends on
+    # width, polynomial and reflection
+    for alg_name in alg_names:
+        table_path = "libcrc/{alg_name}/crc/{alg_name}.table".format(alg_name=alg_name)
+        data_width = CRC(alg_name)._data_width
+        key = (data_width, files[table_path])
+
+        if key in shared:
+            saved_bytes += entries * data_width // 8
+        else:
+            table_bytes += entries * data_width // 8
+            shared[key] = "libcrc_table_{}".format(len(shared))
+            tables.append("static const uint{}_t {}{} = {{\n#include \"{}\"\n}};\n".format(
+                data_width, shared[key], dimensions, table_path[len("libcrc/"):]))
+
+        header.append("#include \"{alg_name}/crc/{alg_name}.h\"".format(alg_name=alg_name))
+        models.append("#define {}_TABLE_SHARED {}\n#include \"{alg_name}/crc/{alg_name}.c\"\n".format(
+            alg_name.upper(), shared[key], alg_name=alg_name))
+
+    header.extend([
+        "",
+        "/* Flash used by the shared lookup tables, and saved by sharing them */",
+        "#define LIBCRC_TABLE_BYTES {}".format(table_bytes),
+        "#define LIBCRC_TABLE_BYTES_SAVED {}".format(saved_bytes),
+        "",
+        "#endif",
+    ])
+    source = [
+        "/** Genetrate by crc.py",
+        " * @param engine: {}".format(engine),
+        " *",
+        " * {} models in one translation unit, sharing {} lookup tables.".format(len(alg_names), len(shared)),
+        " */",
+        "#include \"libcrc.h\"",
+        "",
+    ] + tables + models
+
+    return {
+        "libcrc/libcrc.h": "\n".join(header) + "\n",
+        "libcrc/libcrc.c": "\n".join(source),
+    }
+
+
+def generate_c(path="./generate/c/", alg_names=None, engine="bytewise", accel=False,
+               workers=None, combined=False):
+    """Generate the C implementations of many models at once. The templates
+    are read once, the models are rendered in parallel and only files whose
+    content changed are written, so that an incremental build only rebuilds
+    the models that actually changed.
+    Args:
+        path (str): Output directory
+        alg_names (list of str): Models to generate, defaults to all known models
+        engine (str): Table engine, see :meth:`CRC.generate_for_c`
+        accel (bool): Include the hardware accelerated update
+        workers (int): Number of worker processes, defaults to the number of
+            CPUs. ``1`` renders in the calling process.
+        combined (bool): Also write ``libcrc/libcrc.c``, a single source with
+            all models in which identical lookup tables (e.g. of the many
+            CRC16 variants with polynomial 0x1021) are defined only once, and
+            the matching ``libcrc/libcrc.h``
+    Returns:
+        list of str - Files that were written
+    """
+    if engine not in C_ENGINES:
+        raise ValueError("Unknown C engine: {}".format(engine))
+
+    alg_names = list(alg_names or crc_alg_table.keys())
+    templates = load_c_templates()
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    files = _c_shared_files(templates)
+    if workers <= 1 or len(alg_names) <= 1:
+        for alg_name in alg_names:
+            files.update(CRC(alg_name)._render_c(engine, accel, templates))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(alg_names))) as executor:
+            for model_files in executor.map(
+                    _render_c_model,
+                    alg_names,
+                    [crc_alg_table[alg_name] for alg_name in alg_names],
+                    [engine] * len(alg_names),
+                    [accel] * len(alg_names),
+                    [templates] * len(alg_names)):
+                files.update(model_files)
+
+    if combined:
+        files.update(_render_c_combined(alg_names, files, engine))
+
+    return _write_c_files(path, files)
+
+
+def generate_table_store(path, alg_names=None, slice_by=(1, 8, 16)):
+    """Write the lookup tables of the known CRC models to a table store, see
+    :func:`crc_calc.load_table_store`. Point the ``CRC_TABLE_STORE``
+    environment variable at the file to load it at import time.
+    Args:
+        path (str): Output file
+        alg_names (list of str): Models to include, defaults to all known models
+        slice_by (tuple of int): Table engines to include
+    """
+    keys = set()
+
+    for alg_name in alg_names or crc_alg_table.keys():
+        width, polynomial, _, _, input_reflected, result_reflected = crc_alg_table[alg_name]
+        reflected = input_reflected and result_reflected
+        for count in slice_by:
+            keys.add(table_parameters(width, polynomial, reflected) + (reflected, count))
+
+    write_table_store(path, keys)
+
+
+def _file_chunk_crc(crc, path, offset, length):
+    """Checksum ``length`` bytes at ``offset`` of a file with the model
+    ``crc``. Runs in the worker processes of :meth:`CRC.file`, which is why it
+    is a module level function. A pickled model keeps its table engine and
+    native backend.
+    """
+    if length == 0:
+        return crc(b'')
+
+    with open(path, "rb") as f_obj:
+        with mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ) as f_map:
+            view = memoryview(f_map)
+            try:
+                return crc(view[offset:offset + length])
+            finally:
+                view.release()
+
+
+def _checksum_file(path, alg_names, slice_by=1, chunk_size=CLI_CHUNK_SIZE):
+    """Checksum a file (``-`` for stdin) with several models, reading the data
+    only once. Module level function, so that it can run in a process pool.
+    Returns:
+        tuple - (list of checksums, size in bytes, seconds, error message)
+    """
+    streams = [CRC(alg_name, slice_by=slice_by).new() for alg_name in alg_names]
+    size = 0
+    start = time.perf_counter()
+
+    try:
+        if path == "-":
+            f_obj = sys.stdin.buffer
+        else:
+            f_obj = open(path, "rb")
+
+        try:
+            while True:
+                chunk = f_obj.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                for stream in streams:
+                    stream.update(chunk)
+        finally:
+            if f_obj is not sys.stdin.buffer:
+                f_obj.close()
+    except OSError as e:
+        return None, size, time.perf_counter() - start, e.strerror or str(e)
+
+    return [stream.crcvalue for stream in streams], size, time.perf_counter() - start, None
+
+
+def _format_crc(alg_name, value):
+    return "{:0{}x}".format(value, (crc_alg_table[alg_name][0] + 3) // 4)
+
+
+def _parse_manifest_line(line, alg_names):
+    """Parse a line of a checksum manifest, either ``<crc>  <file>`` or the
+    tagged ``<ALG> (<file>) = <crc>`` format.
+    Returns:
+        tuple - (algorithm name, file name, checksum) or ``None``
+    """
+    line = line.rstrip("\r\n")
+
+    if " (" in line and ") = " in line:
+        alg_name, rest = line.split(" (", 1)
+        name, value = rest.rsplit(") = ", 1)
+        alg_name = alg_name.strip().lower()
+        if alg_name in crc_alg_table:
+            try:
+                return alg_name, name, int(value, 16)
+            except ValueError:
+                return None
+
+    parts = line.split(None, 1)
+    if len(parts) == 2 and len(alg_names) == 1:
+        name = parts[1][1:] if parts[1].startswith("*") else parts[1]
+        try:
+            return alg_names[0], name, int(parts[0], 16)
+        except ValueError:
+            return None
+
+    return None
+
+
+def _run_jobs(paths, alg_names, args):
+    """Checksum all paths, several files at once in a process pool. Yields the
+    results in the order of ``paths``.
+    Args:
+        paths (list of str): Files, ``-`` for stdin
+        alg_names (dict): Models per path
+        args (argparse.Namespace): Parsed command line
+    """
+    files = set(path for path in paths if path != "-")
+
+    if args.jobs <= 1 or len(files) <= 1:
+        for path in paths:
+            yield path, _checksum_file(path, alg_names[path], args.slice_by, args.chunk_size)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(files))) as executor:
+        futures = {path: executor.submit(_checksum_file, path, alg_names[path],
+                                         args.slice_by, args.chunk_size)
+                   for path in files}
+        for path in paths:
+            if path == "-":
+                yield path, _checksum_file(path, alg_names[path], args.slice_by, args.chunk_size)
+            else:
+                yield path, futures[path].result()
+
+
+def _print_stats(path, size, seconds):
+    print("{}: {} bytes in {:.3f} s, {:.1f} MB/s".format(
+        path, size, seconds, size / seconds / 1e6 if seconds else 0.0), file=sys.stderr)
+
+
+def main(argv=None):
+    """Command line interface, see ``python crc.py --help``."""
+    parser = argparse.ArgumentParser(
+        prog="crc", description="Print or check CRC checksums.")
+    parser.add_argument("files", nargs="*", metavar="FILE",
+                        help="files to checksum, '-' or none for stdin")
+    parser.add_argument("-a", "--algorithm", action="append", dest="algorithms",
+                        help="CRC model, can be repeated or comma separated (default: crc32)")
+    parser.add_argument("-c", "--check", action="store_true",
+                        help="read checksums from the FILEs and check them")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of files checksummed in parallel")
+    parser.add_argument("--tag", action="store_true",
+                        help="print '<ALG> (<file>) = <crc>' lines, implied by several models")
+    parser.add_argument("--stats", action="store_true",
+                        help="print size and throughput to stderr")
+    parser.add_argument("--slice-by", type=int, choices=(1, 8, 16), default=8,
+                        help="table engine (default: 8)")
+    parser.add_argument("--chunk-size", type=int, default=CLI_CHUNK_SIZE,
+                        help="bytes read at once (default: %(default)s)")
+    parser.add_argument("--list", action="store_true",
+                        help="list the known CRC models")
+    parser.add_argument("--generate-c", metavar="PATH",
+                        help="generate C code for the selected models (default: all) and exit")
+    parser.add_argument("--c-engine", choices=sorted(C_ENGINES.keys()), default="bytewise",
+                        help="table engine of the generated C code (default: bytewise)")
+    parser.add_argument("--c-accel", action="store_true",
+                        help="add SSE4.2/PCLMULQDQ acceleration with runtime dispatch to the generated C code")
+    parser.add_argument("--c-combined", action="store_true",
+                        help="also generate libcrc/libcrc.c with all models and shared lookup tables")
+    args = parser.parse_args(argv)
+
+    alg_names = []
+    for item in args.algorithms or []:
+        alg_names.extend(name.strip().lower() for name in item.split(",") if name.strip())
+    for alg_name in alg_names:
+        if alg_name not in crc_alg_table:
+            parser.error("unknown CRC model: {}".format(alg_name))
+
+    if args.list:
+        for alg_name, parameters in crc_alg_table.items():
+            print("{:<20} width={} poly=0x{:x} init=0x{:x} xorout=0x{:x} refin={} refout={}".format(
+                alg_name, *parameters))
+        return 0
+
+    if args.generate_c is not None:
+        path = os.path.join(args.generate_c, "")
+        written = generate_c(path, alg_names or None, engine=args.c_engine, accel=args.c_accel,
+                             workers=args.jobs, combined=args.c_combined)
+        print("{}: {} files written".format(path, len(written)), file=sys.stderr)
+        return 0
+
+    alg_names = alg_names or ["crc32"]
+    paths = args.files or ["-"]
+    status = 0
+
+    if args.check:
+        return _check(paths, alg_names, args)
+
+    tag = args.tag or len(alg_names) > 1
+    total_size, start = 0, time.perf_counter()
+
+    jobs = _run_jobs(paths, dict((path, alg_names) for path in paths), args)
+    for path, (values, size, seconds, error) in jobs:
+        if error is not None:
+            print("crc: {}: {}".format(path, error), file=sys.stderr)
+            status = 1
+            continue
+
+        for alg_name, value in zip(alg_names, values):
+            if tag:
+                print("{} ({}) = {}".format(alg_name.upper(), path, _format_crc(alg_name, value)))
+            else:
+                print("{}  {}".format(_format_crc(alg_name, value), path))
+
+        total_size += size
+        if args.stats:
+            _print_stats(path, size, seconds)
+
+    if args.stats and len(paths) > 1:
+        _print_stats("total", total_size, time.perf_counter() - start)
+
+    return status
+
+
+def _check(manifests, alg_names, args):
+    """``--check`` mode, verify the checksums listed in the manifests."""
+    entries = []
+    status = 0
+    malformed = 0
+
+    for manifest in manifests:
+        try:
+            if manifest == "-":
+                lines = sys.stdin.read().splitlines()
+            else:
+                with open(manifest, "r") as f_obj:
+                    lines = f_obj.read().splitlines()
+        except OSError as e:
+            print("crc: {}: {}".format(manifest, e.strerror or e), file=sys.stderr)
+            status = 1
+            continue
+
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = _parse_manifest_line(line, alg_names)
+            if entry is None:
+                malformed += 1
+            else:
+                entries.append(entry)
 
-        with open(crc_path + "{alg_name}.table".format(alg_name=self._algorithm), "w") as f_obj:
-            f_obj.write(crc_table)
+    # Every file is read only once, for all models listed for it
+    files = {}
+    for alg_name, name, _ in entries:
+        files.setdefault(name, [])
+        if alg_name not in files[name]:
+            files[name].append(alg_name)
 
-        with open(crc_path + "{alg_name}.default".format(alg_name=self._algorithm), "w") as f_obj:
-            f_obj.write(crc_default)
+    results = dict(_run_jobs(list(files.keys()), files, args))
 
-        with open(crc_path + "{alg_name}.h".format(alg_name=self._algorithm), "w") as f_obj:
-            f_obj.write(crc_h)
+    failed = 0
+    unreadable = 0
+    for alg_name, name, expected in entries:
+        values, size, seconds, error = results[name]
+        if error is not None:
+            print("{}: FAILED open or read".format(name))
+            unreadable += 1
+            continue
 
-        with open(crc_path + "{alg_name}.c".format(alg_name=self._algorithm), "w") as f_obj:
-            f_obj.write(crc_c)
+        ok = values[files[name].index(alg_name)] == expected
+        # files holds the distinct models of every file
+        label = name if len(files[name]) == 1 else "{} ({})".format(name, alg_name)
+        print("{}: {}".format(label, "OK" if ok else "FAILED"))
+        if not ok:
+            failed += 1
 
-        with open(crc_path + "CMakeLists.txt", "w") as f_obj:
-            f_obj.write(crc_cmake)
+    if malformed:
+        print("crc: WARNING: {} line{} improperly formatted".format(
+            malformed, " is" if malformed == 1 else "s are"), file=sys.stderr)
+    if unreadable:
+        print("crc: WARNING: {} listed file{} could not be read".format(
+            unreadable, "" if unreadable == 1 else "s"), file=sys.stderr)
+    if failed:
+        print("crc: WARNING: {} computed checksum{} did NOT match".format(
+            failed, "" if failed == 1 else "s"), file=sys.stderr)
 
-        with open(path + "libcrc/{alg_name}/test_{alg_name}.c".format(alg_name=self._algorithm), "w") as f_obj:
-            f_obj.write(crc_test)
+    if failed or unreadable or (malformed and not entries):
+        status = 1
 
-        with open(path + "libcrc/{alg_name}/CMakeLists.txt".format(alg_name=self._algorithm), "w") as f_obj:
-            f_obj.write(crc_test_cmake)
+    return status
 
 
 if __name__ == '__main__':
-    # 实例化一个 CRC，参数模型使用 crc32_mpeg2
-    crc32_mpeg2 = CRC("crc32_mpeg2")
-
-    data1 = b'hello '
-    data2 = b'world'
-    data3 = b'!!!'
-
-    # 单次校验
-    val_a1 = crc32_mpeg2(data1)
-    val_a2 = crc32_mpeg2(data2)
-    val_a3 = crc32_mpeg2(data3)
-    crc1 = crc32_mpeg2(data1 + data2 + data3)
-
-    # 分次校验
-    crc32_mpeg2.reset()
-    val_b1 = crc32_mpeg2.accumulate(data1)
-    val_b2 = crc32_mpeg2.accumulate(data2)
-    val_b3 = crc32_mpeg2.accumulate(data3)
-    crc2 = crc32_mpeg2.get()
-
-    assert crc1 == crc2
-    print(hex(val_a1), hex(val_a2), hex(val_a3), hex(crc1))
-    print(hex(val_b1), hex(val_b2), hex(val_b3), hex(crc2))
-
-    # 生成 C 语言代码
-    for alg in crc_alg_table.keys():
-        CRC(alg).generate_for_c()
+    sys.exit(main())
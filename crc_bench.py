@@ -0,0 +1,530 @@
+#!/usr/bin/python
+"""CRC benchmarks.
+    Copyright (c) 2023-present SKB(skb666@qq.com)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import crc_calc
+from crc import CRC, crc_alg_table
+
+
+# Input sizes of the benchmark suite if none are given
+SUITE_SIZES = (8, 64, 1 << 10, 64 << 10, 1 << 20)
+
+# Table engines of the benchmark suite if none are given
+SUITE_SLICE_BY = (1, 8, 16)
+
+# Chunk size for the chunked accumulate() measurement
+SUITE_CHUNK_SIZE = 4 << 10
+
+# Relative throughput drop that is reported as regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def parse_size(text):
+    """Parse a size like ``4096``, ``64K``, ``256M`` or ``1G`` into bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+
+    if text and text[-1] in units:
+        return int(text[:-1]) * units[text[-1]]
+
+    return int(text)
+
+
+def format_size(size):
+    for unit, factor in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if size >= factor and size % factor == 0:
+            return "{}{}".format(size // factor, unit)
+
+    return str(size)
+
+
+def bench_file(alg_name, size, workers, slice_by=8, repeat=1):
+    """Measure the throughput of :meth:`CRC.file` for a temporary file of the
+    given size and every worker count.
+    Args:
+        alg_name (str): Name of the CRC model
+        size (int): File size in bytes
+        workers (list of int): Worker counts that should be measured
+        slice_by (int): Table engine of the model
+        repeat (int): Number of runs, the fastest one is reported
+    Returns:
+        list of dict - One result per worker count
+    """
+    crc = CRC(alg_name, slice_by=slice_by)
+    results = []
+
+    with tempfile.NamedTemporaryFile(prefix="crc_bench_") as f_obj:
+        block = os.urandom(1 << 20)
+        for offset in range(0, size, len(block)):
+            f_obj.write(block[:size - offset])
+        f_obj.flush()
+
+        expected = None
+        for count in workers:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                value = crc.file(f_obj.name, workers=count)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            if expected is None:
+                expected = value
+            elif value != expected:
+                raise AssertionError("{} workers: checksum mismatch".format(count))
+
+            results.append({
+                "algorithm": alg_name,
+                "size": size,
+                "workers": count,
+                "seconds": best,
+                "mb_per_s": size / best / 1e6,
+            })
+
+    for result in results:
+        result["speedup"] = results[0]["seconds"] / result["seconds"]
+
+    return results
+
+
+def bench_async_latency(alg_name, uploads, size, mode, chunk_size=1 << 16, interval=0.001):
+    """Checksum concurrent uploads with :meth:`CRC_CALC.feed_stream` and
+    measure how late a periodic timer on the same event loop fires.
+    Args:
+        alg_name (str): Name of the CRC model
+        uploads (int): Number of concurrent uploads
+        size (int): Bytes per upload
+        mode (str): ``inline`` checksums every chunk in the event loop in one
+            go, ``sliced`` in slices of ``ASYNC_INLINE_LIMIT`` bytes,
+            ``thread`` and ``process`` offload chunks to an executor
+        chunk_size (int): Bytes per read
+        interval (float): Timer period in seconds
+    Returns:
+        dict - Event loop lag statistics in milliseconds and the throughput
+    """
+    crc = CRC(alg_name)
+    data = os.urandom(size)
+
+    async def upload(executor, inline_limit):
+        reader = asyncio.StreamReader()
+        for offset in range(0, size, chunk_size):
+            reader.feed_data(data[offset:offset + chunk_size])
+        reader.feed_eof()
+        return await crc.feed_stream(reader, chunk_size, executor, inline_limit)
+
+    async def ticker(lags, done):
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    async def run(executor, inline_limit):
+        lags = []
+        done = asyncio.Event()
+        timer = asyncio.ensure_future(ticker(lags, done))
+        await asyncio.sleep(interval * 2)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[upload(executor, inline_limit) for _ in range(uploads)])
+        elapsed = time.perf_counter() - start
+
+        done.set()
+        await timer
+
+        if any(value != results[0] for value in results):
+            raise AssertionError("checksum mismatch")
+        return lags, elapsed
+
+    if mode == "inline":
+        executor, inline_limit = None, size
+    elif mode == "sliced":
+        executor, inline_limit = None, crc_calc.ASYNC_INLINE_LIMIT
+    elif mode == "thread":
+        executor, inline_limit = concurrent.futures.ThreadPoolExecutor(), 0
+    elif mode == "process":
+        executor, inline_limit = concurrent.futures.ProcessPoolExecutor(), 0
+    else:
+        raise ValueError("Unknown mode: {}".format(mode))
+
+    try:
+        lags, elapsed = asyncio.run(run(executor, inline_limit))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    lags = sorted(lags) or [0.0]
+    return {
+        "algorithm": alg_name,
+        "mode": mode,
+        "uploads": uploads,
+        "size": size,
+        "lag_max_ms": lags[-1] * 1e3,
+        "lag_p99_ms": lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1e3,
+        "mb_per_s": uploads * size / elapsed / 1e6,
+    }
+
+
+def _measure(func, min_time, repeat):
+    """Call ``func`` until ``min_time`` has passed, ``repeat`` times. Returns
+    the seconds per call of the fastest round.
+    """
+    best = None
+
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            func()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_call = elapsed / calls
+        best = per_call if best is None else min(best, per_call)
+
+    return best
+
+
+def bench_table_build(alg_name, slice_by, repeat=3):
+    """Measure how long building the lookup tables of a model takes. The
+    builder is called directly, because :func:`crc_calc.crc_tables` would
+    return the tables interned for models that are still alive.
+    Returns:
+        float - Milliseconds
+    """
+    width, polynomial, _, _, input_reflected, result_reflected = crc_alg_table[alg_name]
+    reflected = input_reflected and result_reflected
+    width, polynomial = crc_calc.table_parameters(width, polynomial, reflected)
+    best = None
+
+    for _ in range(repeat):
+        # Also drops the cached single table the slicing tables derive from
+        crc_calc.clear_table_cache()
+        start = time.perf_counter()
+        crc_calc._cached_tables.__wrapped__(width, polynomial, reflected, slice_by)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    crc_calc.clear_table_cache()
+    return best * 1e3
+
+
+def bench_suite(alg_names=None, sizes=SUITE_SIZES, slice_by=SUITE_SLICE_BY,
+                chunk_size=SUITE_CHUNK_SIZE, min_time=0.2, repeat=3, progress=None):
+    """Measure every model, table engine and input size, both as one-shot
+    ``__call__`` and as chunked ``accumulate``. Every measurement also checks
+    that all engines and modes agree on the checksum.
+    Args:
+        alg_names (list of str): Models, defaults to all known models
+        sizes (list of int): Input sizes in bytes
+        slice_by (list of int): Table engines
+        chunk_size (int): Chunk size of the accumulate measurement
+        min_time (float): Minimum seconds per measurement round
+        repeat (int): Measurement rounds, the fastest one is reported
+        progress (callable): Called with every result as it is available
+    Returns:
+        dict - JSON serializable report
+    """
+    report = {
+        "meta": _meta(chunk_size, min_time, repeat),
+        "table_build": [],
+        "results": [],
+    }
+    data = os.urandom(max(sizes))
+
+    for alg_name in alg_names or crc_alg_table.keys():
+        _, _, _, _, input_reflected, result_reflected = crc_alg_table[alg_name]
+        path = "reflected" if input_reflected else "generic"
+
+        for count in slice_by:
+            report["table_build"].append({
+                "algorithm": alg_name,
+                "slice_by": count,
+                "ms": bench_table_build(alg_name, count),
+            })
+
+        for size in sizes:
+            value = data[:size]
+            chunks = [value[i:i + chunk_size] for i in range(0, size, chunk_size)]
+            expected = None
+
+            for count in slice_by:
+                crc = CRC(alg_name, slice_by=count)
+
+                def accumulate():
+                    crc.reset()
+                    for chunk in chunks:
+                        crc.accumulate(chunk)
+                    return crc.get()
+
+                for mode, func in (("oneshot", lambda: crc(value)), ("accumulate", accumulate)):
+                    checksum = func()
+                    if expected is None:
+                        expected = checksum
+                    elif checksum != expected:
+                        raise AssertionError("{} slice_by={} {}: checksum mismatch".format(
+                            alg_name, count, mode))
+
+                    seconds = _measure(func, min_time, repeat)
+                    result = {
+                        "algorithm": alg_name,
+                        "path": path,
+                        "slice_by": count,
+                        "mode": mode,
+                        "size": size,
+                        "us_per_call": seconds * 1e6,
+                        "mb_per_s": size / seconds / 1e6,
+                    }
+                    report["results"].append(result)
+                    if progress is not None:
+                        progress(result)
+
+    return report
+
+
+def bench_profile_overhead(alg_name, sizes, slice_by=1, min_time=0.2, repeat=3):
+    """Measure the cost of the :class:`crc_calc.CRC_PROFILE` hooks. Every
+    size is checksummed with the uninstrumented update, through ``__call__``
+    with profiling off, and with a running profile. Both of the first two
+    go through one Python level function, so their difference is the cost
+    of the hook.
+    Returns:
+        list of dict - Microseconds per call of the three variants and the
+        relative overhead of the latter two
+    """
+    crc = CRC(alg_name, slice_by=slice_by)
+    data = os.urandom(max(sizes))
+    results = []
+
+    for size in sizes:
+        value = data[:size]
+
+        def checksum(value):
+            return crc._finalize(crc._engine_update(crc._initial_value, value))
+
+        direct = functools.partial(checksum, value)
+        hooked = functools.partial(crc.__call__, value)
+
+        if direct() != hooked():
+            raise AssertionError("{}: checksum mismatch".format(alg_name))
+
+        # The rounds of the variants are interleaved, so that drifting CPU
+        # clocks affect all of them alike
+        profile = crc_calc.CRC_PROFILE()
+        seconds_direct = seconds_off = seconds_on = float('inf')
+        for _ in range(repeat):
+            seconds_direct = min(seconds_direct, _measure(direct, min_time, 1))
+            seconds_off = min(seconds_off, _measure(hooked, min_time, 1))
+            with profile:
+                seconds_on = min(seconds_on, _measure(hooked, min_time, 1))
+
+        results.append({
+            "algorithm": alg_name,
+            "slice_by": slice_by,
+            "size": size,
+            "direct_us": seconds_direct * 1e6,
+            "off_us": seconds_off * 1e6,
+            "on_us": seconds_on * 1e6,
+            "off_overhead": seconds_off / seconds_direct - 1,
+            "on_overhead": seconds_on / seconds_direct - 1,
+        })
+
+    return results
+
+
+def _meta(chunk_size, min_time, repeat):
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "chunk_size": chunk_size,
+        "min_time": min_time,
+        "repeat": repeat,
+    }
+
+
+def compare_reports(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Find measurements whose throughput dropped by more than ``threshold``
+    compared to a baseline report. Only measurements present in both reports
+    are compared.
+    Returns:
+        list of tuple - (result key, baseline MB/s, current MB/s)
+    """
+    def key(result):
+        return (result["algorithm"], result["slice_by"], result["mode"], result["size"])
+
+    reference = dict((key(result), result["mb_per_s"]) for result in baseline["results"])
+    regressions = []
+
+    for result in current["results"]:
+        before = reference.get(key(result))
+        if before and result["mb_per_s"] < before * (1 - threshold):
+            regressions.append((key(result), before, result["mb_per_s"]))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CRC benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    file_parser = subparsers.add_parser(
+        "file", help="throughput and scaling of the parallel file checksum")
+    file_parser.add_argument("-a", "--algorithm", default="crc32")
+    file_parser.add_argument("-s", "--size", type=parse_size, default="256M")
+    file_parser.add_argument("-w", "--workers", default=None,
+                             help="comma separated worker counts (default: 1, 2, 4, ... up to the CPU count)")
+    file_parser.add_argument("--slice-by", type=int, default=8)
+    file_parser.add_argument("-r", "--repeat", type=int, default=1)
+
+    latency_parser = subparsers.add_parser(
+        "latency", help="event loop latency of the asyncio streaming API")
+    latency_parser.add_argument("-a", "--algorithm", default="crc32")
+    latency_parser.add_argument("-u", "--uploads", type=int, default=8)
+    latency_parser.add_argument("-s", "--size", type=parse_size, default="1M")
+    latency_parser.add_argument("-m", "--modes", default="inline,sliced,thread,process",
+                                help="comma separated modes: inline, sliced, thread, process")
+
+    suite_parser = subparsers.add_parser(
+        "suite", help="throughput and latency of every model, engine and size")
+    suite_parser.add_argument("-a", "--algorithms", default=None,
+                              help="comma separated models (default: all)")
+    suite_parser.add_argument("-s", "--sizes", default=None,
+                              help="comma separated input sizes, up to 1G (default: 8,64,1K,64K,1M)")
+    suite_parser.add_argument("--slice-by", default=None,
+                              help="comma separated table engines (default: 1,8,16)")
+    suite_parser.add_argument("--chunk-size", type=parse_size, default=SUITE_CHUNK_SIZE)
+    suite_parser.add_argument("--min-time", type=float, default=0.2,
+                              help="minimum seconds per measurement round")
+    suite_parser.add_argument("-r", "--repeat", type=int, default=3)
+    suite_parser.add_argument("-o", "--output", help="write the report as JSON")
+    suite_parser.add_argument("--compare", metavar="BASELINE",
+                              help="JSON report of a previous run to compare against")
+    suite_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                              help="relative throughput drop that fails the comparison")
+
+    profile_parser = subparsers.add_parser(
+        "profile", help="overhead of the profiling hooks, off and on")
+    profile_parser.add_argument("-a", "--algorithm", default="crc32")
+    profile_parser.add_argument("-s", "--sizes", default="8,64,1K,64K",
+                                help="comma separated input sizes (default: %(default)s)")
+    profile_parser.add_argument("--slice-by", type=int, default=1)
+    profile_parser.add_argument("--min-time", type=float, default=0.2,
+                                help="minimum seconds per measurement round")
+    profile_parser.add_argument("-r", "--repeat", type=int, default=5)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "file":
+        if args.workers:
+            workers = [int(i) for i in args.workers.split(",")]
+        else:
+            cpus = os.cpu_count() or 1
+            workers = [1 << i for i in range(cpus.bit_length()) if 1 << i < cpus] + [cpus]
+
+        print("{:<16} {:>8} {:>8} {:>10} {:>10} {:>8}".format(
+            "algorithm", "size", "workers", "seconds", "MB/s", "speedup"))
+        for result in bench_file(args.algorithm, args.size, workers,
+                                 args.slice_by, args.repeat):
+            print("{:<16} {:>8} {:>8} {:>10.3f} {:>10.1f} {:>8.2f}".format(
+                result["algorithm"], format_size(result["size"]),
+                result["workers"], result["seconds"], result["mb_per_s"],
+                result["speedup"]))
+
+    elif args.command == "latency":
+        print("{:<16} {:>8} {:>8} {:>8} {:>12} {:>12} {:>10}".format(
+            "algorithm", "mode", "uploads", "size", "lag max ms", "lag p99 ms", "MB/s"))
+        for mode in args.modes.split(","):
+            result = bench_async_latency(args.algorithm, args.uploads, args.size, mode)
+            print("{:<16} {:>8} {:>8} {:>8} {:>12.2f} {:>12.2f} {:>10.1f}".format(
+                result["algorithm"], result["mode"], result["uploads"],
+                format_size(result["size"]), result["lag_max_ms"],
+                result["lag_p99_ms"], result["mb_per_s"]))
+
+    elif args.command == "profile":
+        print("{:<16} {:>8} {:>8} {:>12} {:>12} {:>12} {:>8} {:>8}".format(
+            "algorithm", "slice_by", "size", "direct us", "off us", "on us", "off", "on"))
+        for result in bench_profile_overhead(args.algorithm, [parse_size(i) for i in args.sizes.split(",")],
+                                             args.slice_by, args.min_time, args.repeat):
+            print("{:<16} {:>8} {:>8} {:>12.2f} {:>12.2f} {:>12.2f} {:>+8.1%} {:>+8.1%}".format(
+                result["algorithm"], result["slice_by"], format_size(result["size"]),
+                result["direct_us"], result["off_us"], result["on_us"],
+                result["off_overhead"], result["on_overhead"]))
+
+    elif args.command == "suite":
+        print("{:<20} {:>9} {:>8} {:>10} {:>8} {:>12} {:>10}".format(
+            "algorithm", "path", "slice_by", "mode", "size", "us/call", "MB/s"))
+
+        def progress(result):
+            print("{:<20} {:>9} {:>8} {:>10} {:>8} {:>12.2f} {:>10.2f}".format(
+                result["algorithm"], result["path"], result["slice_by"], result["mode"],
+                format_size(result["size"]), result["us_per_call"], result["mb_per_s"]))
+            sys.stdout.flush()
+
+        report = bench_suite(
+            args.algorithms.split(",") if args.algorithms else None,
+            [parse_size(i) for i in args.sizes.split(",")] if args.sizes else SUITE_SIZES,
+            [int(i) for i in args.slice_by.split(",")] if args.slice_by else SUITE_SLICE_BY,
+            args.chunk_size, args.min_time, args.repeat, progress)
+
+        print()
+        print("{:<20} {:>8} {:>12}".format("algorithm", "slice_by", "table ms"))
+        for result in report["table_build"]:
+            print("{:<20} {:>8} {:>12.3f}".format(
+                result["algorithm"], result["slice_by"], result["ms"]))
+
+        if args.output:
+            with open(args.output, "w") as f_obj:
+                json.dump(report, f_obj, indent=2)
+
+        if args.compare:
+            with open(args.compare, "r") as f_obj:
+                baseline = json.load(f_obj)
+
+            regressions = compare_reports(baseline, report, args.threshold)
+            for (alg_name, count, mode, size), before, after in regressions:
+                print("REGRESSION {} slice_by={} {} {}: {:.2f} -> {:.2f} MB/s ({:+.1%})".format(
+                    alg_name, count, mode, format_size(size), before, after,
+                    after / before - 1), file=sys.stderr)
+            if regressions:
+                return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,6 +15,655 @@
     limitations under the License.
 """
 import array
+import concurrent.futures
+import functools
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import warnings
+import weakref
+
+
+# Number of bytes the slicing engine converts to words at once. This bounds the
+# temporary memory when checksumming huge buffers.
+_SLICE_CHUNK = 1 << 16
+
+# Number of bytes requested per read by the asyncio streaming API
+ASYNC_CHUNK_SIZE = 1 << 16
+
+# Buffers up to this size are checksummed inside the event loop, larger ones
+# are handed to an executor
+ASYNC_INLINE_LIMIT = 16 << 10
+
+# Number of distinct table sets kept by the process wide table cache
+TABLE_CACHE_SIZE = 128
+
+# Environment variable naming a table store that is loaded at import time
+TABLE_STORE_ENV = 'CRC_TABLE_STORE'
+
+_TABLE_STORE_MAGIC = b'CRCTABLE'
+_TABLE_STORE_VERSION = 1
+_TABLE_STORE_HEADER = struct.Struct('<8sIBxxxI')
+_TABLE_STORE_ENTRY = struct.Struct('<BBHxxxxQQ')
+
+# Default distance of the checkpoints of a CRC_INDEX
+INDEX_INTERVAL = 1 << 20
+
+# Suffix of the sidecar file of a CRC_INDEX
+INDEX_SUFFIX = '.crcidx'
+
+# Number of bytes read at once while a CRC_INDEX is built
+_INDEX_READ_SIZE = 1 << 20
+
+_INDEX_MAGIC = b'CRCINDEX'
+_INDEX_VERSION = 1
+_INDEX_HEADER = struct.Struct('<8sIBBBxQQQQQ8x')
+
+# Tables loaded from table stores, keyed like crc_tables()
+_stored_tables = {}
+
+# Tables in use by CRC_CALC instances, keyed like crc_tables(). Each entry is
+# [tables, number of users], it is dropped when the last user is gone.
+_interned_tables = {}
+_interned_lock = threading.Lock()
+
+# Bit-reversed value of every byte, see reflect()
+_BYTE_REFLECTION = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+# Innermost running CRC_PROFILE, None while profiling is off. The running
+# profiles are kept on a stack, in the order they were started.
+_profiler = None
+_profile_stack = []
+_profile_lock = threading.Lock()
+
+
+def reflect(num, width):
+    """Reverts bit order of the given number
+    Args:
+        num (int): Number that should be reflected
+        width (int): Size of the number in bits
+    """
+    # Reverse the bytes and the bits of every byte, then drop the padding
+    size = (width + 7) // 8
+    num &= (1 << width) - 1
+    reflected = num.to_bytes(size, 'little').translate(_BYTE_REFLECTION)
+
+    return int.from_bytes(reflected, 'big') >> (size * 8 - width)
+
+
+def _table_typecode(width):
+    if width <= 8:
+        return 'B'
+    elif width <= 16:
+        return 'H'
+    elif width <= 32:
+        return 'I'
+    else:
+        return 'Q'
+
+
+def _make_table(width):
+    """Create static sized CRC lookup table and initialize it with ``0``.
+    For 8, 16, 32, and 64 bit width :class:`array.array` instances are used.
+    Args:
+        width (int): Size of elements in bits
+    """
+    return array.array(_table_typecode(width), [0]) * 256
+
+
+def _calculate_crc_table(width, polynomial):
+    table = _make_table(width)
+    cast_mask = (1 << width) - 1
+    msb_mask = 1 << (width - 1)
+
+    for divident in range(256):
+        cur_byte = (divident << (width - 8)) & cast_mask
+
+        for bit in range(8):
+            if (cur_byte & msb_mask) != 0:
+                cur_byte <<= 1
+                cur_byte ^= polynomial
+            else:
+                cur_byte <<= 1
+
+        table[divident] = cur_byte & cast_mask
+
+    return table
+
+
+def _calculate_crc_table_reflected(width, polynomial):
+    """Reflected lookup table. Instead of reflecting every divident and
+    remainder, the reflected polynomial is shifted towards the LSB, which gives
+    the same table.
+    """
+    table = _make_table(width)
+    reflected_polynomial = reflect(polynomial, width)
+
+    for divident in range(256):
+        cur_byte = divident
+
+        for bit in range(8):
+            if cur_byte & 1:
+                cur_byte = (cur_byte >> 1) ^ reflected_polynomial
+            else:
+                cur_byte >>= 1
+
+        table[divident] = cur_byte
+
+    return table
+
+
+def _calculate_slicing_tables(width, table, reflected, count):
+    """Derive the additional tables used by the slicing-by-N engine.
+    Entry ``i`` of table ``k`` is the remainder of byte ``i`` followed by
+    ``k`` zero bytes, so ``N`` input bytes can be folded with ``N``
+    independent lookups.
+    Args:
+        width (int): Number of bits of the polynomial
+        table (array): The plain byte-at-a-time lookup table
+        reflected (bool): True, if ``table`` is the reflected table
+        count (int): Number of tables, including ``table`` itself
+    """
+    tables = [table]
+    cast_mask = (1 << width) - 1
+
+    for _ in range(1, count):
+        prev = tables[-1]
+        cur = _make_table(width)
+
+        for divident in range(256):
+            crc = prev[divident]
+            if reflected:
+                cur[divident] = (crc >> 8) ^ table[crc & 0xff]
+            else:
+                cur[divident] = ((crc << 8) & cast_mask) ^ \
+                    table[(crc >> (width - 8)) & 0xff]
+
+        tables.append(cur)
+
+    return tables
+
+
+@functools.lru_cache(maxsize=TABLE_CACHE_SIZE)
+def _cached_tables(width, polynomial, reflected, count):
+    profiler = _profiler
+    start = time.perf_counter()
+
+    if count > 1:
+        table = _cached_tables(width, polynomial, reflected, 1)[0]
+        tables = tuple(_calculate_slicing_tables(width, table, reflected, count))
+    elif reflected:
+        tables = (_calculate_crc_table_reflected(width, polynomial),)
+    else:
+        tables = (_calculate_crc_table(width, polynomial),)
+
+    if profiler is not None:
+        profiler._table_built((width, polynomial, reflected, count), time.perf_counter() - start)
+
+    return tables
+
+
+def table_parameters(width, polynomial, reflected):
+    """Return the register width and polynomial the lookup tables of a model
+    are built for. Without the reflection optimization the register is
+    left-aligned to whole bytes, so that models of any width use the
+    byte-aligned tables.
+    Args:
+        width (int): Width of the model
+        polynomial (int): CRC polynomial
+        reflected (bool): True, for the table of the reflection optimization
+    Returns:
+        tuple - ``(width, polynomial)`` to pass to :func:`crc_tables`
+    """
+    if reflected:
+        return width, polynomial
+
+    align = -width % 8
+    return width + align, polynomial << align
+
+
+def crc_tables(width, polynomial, reflected, count=1):
+    """Return the lookup tables of a CRC polynomial. The tables only depend on
+    the given parameters, so they are shared by all models in the process.
+    Tables from a loaded table store are preferred, all others are computed on
+    first use and kept in a LRU cache.
+    Args:
+        width (int): Number of bits of the register, a multiple of 8 unless
+            reflected, see :func:`table_parameters`
+        polynomial (int): CRC polynomial
+        reflected (bool): True, for the table of the reflection optimization
+        count (int): ``1`` for the byte-at-a-time table, ``N`` for the tables
+            of the slicing-by-N engine
+    Returns:
+        tuple - ``count`` lookup tables with 256 entries each
+    """
+    key = (width, polynomial, bool(reflected), count)
+    tables = _stored_tables.get(key)
+
+    if tables is None:
+        entry = _interned_tables.get(key)
+        tables = _cached_tables(*key) if entry is None else entry[0]
+
+    return tables
+
+
+def _acquire_tables(owner, width, polynomial, reflected, count=1):
+    """Like :func:`crc_tables`, but the tables stay interned as long as
+    ``owner`` is alive, even if the LRU cache evicts them meanwhile. All
+    owners of the same key share one table object.
+    """
+    key = (width, polynomial, bool(reflected), count)
+    profiler = _profiler
+    start = time.perf_counter()
+    tables = crc_tables(*key)
+
+    if profiler is not None:
+        profiler._tables_loaded(owner, time.perf_counter() - start)
+
+    with _interned_lock:
+        entry = _interned_tables.setdefault(key, [tables, 0])
+        entry[1] += 1
+
+    weakref.finalize(owner, _release_tables, key).atexit = False
+    return entry[0]
+
+
+def _release_tables(key):
+    with _interned_lock:
+        entry = _interned_tables[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _interned_tables[key]
+
+
+def table_registry():
+    """Report the lookup tables in use by live CRC models. Models with the same
+    width, polynomial and reflection share one set of tables, e.g. crc32 and
+    crc32_jamcrc, or the many 0x1021 CRC16 variants.
+    Returns:
+        dict - ``tables``: list of dicts with ``width``, ``polynomial``,
+        ``reflected``, ``count`` (tables in the set), ``bytes`` and ``users``
+        (model instances sharing it); ``bytes``: memory held by the tables;
+        ``saved_bytes``: memory that one private copy per instance would need
+        in addition
+    """
+    with _interned_lock:
+        entries = sorted((key, sum(memoryview(table).nbytes for table in entry[0]), entry[1])
+                         for key, entry in _interned_tables.items())
+
+    tables = [dict(width=width, polynomial=polynomial, reflected=reflected,
+                   count=count, bytes=size, users=users)
+              for (width, polynomial, reflected, count), size, users in entries]
+
+    return {
+        "tables": tables,
+        "bytes": sum(table["bytes"] for table in tables),
+        "saved_bytes": sum(table["bytes"] * (table["users"] - 1) for table in tables),
+    }
+
+
+@functools.lru_cache(maxsize=TABLE_CACHE_SIZE)
+def crc_nibble_table(width, polynomial, reflected):
+    """Return the 16 entry lookup table that processes 4 bits per step. It is
+    used by the generated C code for targets with very little flash.
+    Args:
+        width (int): Number of bits of the polynomial
+        polynomial (int): CRC polynomial
+        reflected (bool): True, if the nibbles are consumed LSB first
+    """
+    table = _make_table(width)[:16]
+    cast_mask = (1 << width) - 1
+    reflected_polynomial = reflect(polynomial, width)
+
+    for divident in range(16):
+        if reflected:
+            cur = divident
+            for bit in range(4):
+                cur = (cur >> 1) ^ reflected_polynomial if cur & 1 else cur >> 1
+        else:
+            cur = divident << (width - 4)
+            for bit in range(4):
+                if cur & (1 << (width - 1)):
+                    cur = ((cur << 1) ^ polynomial) & cast_mask
+                else:
+                    cur = (cur << 1) & cast_mask
+
+        table[divident] = cur
+
+    return table
+
+
+def clear_table_cache():
+    """Drop all computed tables from the LRU cache. Tables of loaded table
+    stores are kept, and so are tables interned for models still in use."""
+    _cached_tables.cache_clear()
+    crc_nibble_table.cache_clear()
+
+
+def table_cache_info():
+    """Statistics of the process wide table cache, see
+    :func:`functools.lru_cache`.
+    """
+    return _cached_tables.cache_info()
+
+
+def write_table_store(path, keys):
+    """Write the lookup tables of the given polynomials to a binary file, that
+    can be memory mapped by :func:`load_table_store`. The tables are stored
+    in the native byte order.
+    Args:
+        path (str): Output file
+        keys (iterable): ``(width, polynomial, reflected, count)`` tuples, see
+            :func:`crc_tables`
+    """
+    keys = sorted(set((w, p, bool(r), c) for w, p, r, c in keys))
+    offset = _TABLE_STORE_HEADER.size + _TABLE_STORE_ENTRY.size * len(keys)
+    entries = []
+    blobs = []
+
+    for width, polynomial, reflected, count in keys:
+        # Keep every table block 8 byte aligned for the memoryview casts
+        padding = -offset % 8
+        blob = b''.join(bytes(memoryview(table).cast('B')) for table in
+                        crc_tables(width, polynomial, reflected, count))
+        entries.append(_TABLE_STORE_ENTRY.pack(
+            width, reflected, count, polynomial, offset + padding))
+        blobs.append(b'\x00' * padding + blob)
+        offset += padding + len(blob)
+
+    with open(path, 'wb') as f_obj:
+        f_obj.write(_TABLE_STORE_HEADER.pack(
+            _TABLE_STORE_MAGIC, _TABLE_STORE_VERSION,
+            sys.byteorder == 'big', len(keys)))
+        f_obj.write(b''.join(entries))
+        f_obj.write(b''.join(blobs))
+
+
+def load_table_store(path):
+    """Memory map a table store written by :func:`write_table_store`. Its
+    tables are used by :func:`crc_tables` from now on, without being copied or
+    recomputed. Several processes loading the same store share the pages.
+    Args:
+        path (str): Table store file
+    Returns:
+        int - Number of table sets loaded
+    """
+    with open(path, 'rb') as f_obj:
+        f_map = mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        magic, version, big_endian, count = _TABLE_STORE_HEADER.unpack_from(f_map)
+    except struct.error:
+        raise ValueError("Table store is truncated: {}".format(path))
+    if magic != _TABLE_STORE_MAGIC or version != _TABLE_STORE_VERSION:
+        raise ValueError("Not a CRC table store: {}".format(path))
+    if big_endian != (sys.byteorder == 'big'):
+        raise ValueError("Table store byte order does not match: {}".format(path))
+
+    # Only publish the tables once the whole store has been validated
+    loaded = {}
+    view = memoryview(f_map)
+    for i in range(count):
+        try:
+            width, reflected, tables, polynomial, offset = _TABLE_STORE_ENTRY.unpack_from(
+                f_map, _TABLE_STORE_HEADER.size + i * _TABLE_STORE_ENTRY.size)
+        except struct.error:
+            raise ValueError("Table store is truncated: {}".format(path))
+        typecode = _table_typecode(width)
+        size = 256 * array.array(typecode).itemsize
+        block = view[offset:offset + tables * size]
+        if len(block) != tables * size:
+            raise ValueError("Table store is truncated: {}".format(path))
+        loaded[(width, polynomial, bool(reflected), tables)] = tuple(
+            block[j * size:(j + 1) * size].cast(typecode) for j in range(tables))
+    _stored_tables.update(loaded)
+
+    return count
+
+
+def _solve_gf2(rows):
+    """Solve a linear system over GF(2).
+    Args:
+        rows (list): ``(coefficients, rhs)`` pairs, bit ``j`` of
+            ``coefficients`` belongs to unknown ``j``
+    Returns:
+        int - One solution with all free unknowns set to zero, or None if the
+        system has no solution
+    """
+    pivots = {}
+
+    for coefficients, rhs in rows:
+        for bit, (pivot, pivot_rhs) in pivots.items():
+            if coefficients >> bit & 1:
+                coefficients ^= pivot
+                rhs ^= pivot_rhs
+
+        if coefficients:
+            bit = coefficients.bit_length() - 1
+            # Keep the pivot rows reduced against each other
+            for other, (pivot, pivot_rhs) in list(pivots.items()):
+                if pivot >> bit & 1:
+                    pivots[other] = (pivot ^ coefficients, pivot_rhs ^ rhs)
+            pivots[bit] = (coefficients, rhs)
+        elif rhs:
+            return None
+
+    solution = 0
+    for bit, (pivot, pivot_rhs) in pivots.items():
+        if pivot_rhs:
+            solution |= 1 << bit
+
+    return solution
+
+
+def _words(view, byteorder):
+    """Split the input into 64 bit words of the given byte order. The words
+    are produced in bounded chunks, so that large inputs are never duplicated
+    as a whole.
+    Args:
+        view (memoryview): Input bytes, the length must be a multiple of 8
+        byteorder (str): ``'little'`` or ``'big'``
+    """
+    for start in range(0, len(view), _SLICE_CHUNK):
+        words = array.array('Q')
+        words.frombytes(view[start:start + _SLICE_CHUNK])
+        if byteorder != sys.byteorder:
+            words.byteswap()
+
+        yield words
+
+
+def _byte_view(value):
+    try:
+        return memoryview(value).cast('B')
+    except TypeError:
+        # Not a bytes-like object, e.g. a list of integers
+        return memoryview(bytes(value))
+
+
+def _reflected_engine(tables):
+    """Build the update function of a reflected register. The register is
+    XOR-ed into the LSB side, so the table is reflected rather than the input
+    bytes.
+    Args:
+        tables (tuple): Reflected lookup tables, one for the byte-at-a-time
+            engine, 8 or 16 for the slicing-by-N engine
+    Returns:
+        callable - ``update(crc, value)``, returning the updated register
+    """
+    # Indexing a tuple returns the stored int objects, while an array creates
+    # a new one on every lookup
+    tables = tuple(tuple(table) for table in tables)
+    table = tables[0]
+
+    def update_bytes(crc, value):
+        for cur_byte in value:
+            crc = (crc >> 8) ^ table[(crc ^ cur_byte) & 0xff]
+        return crc
+
+    if len(tables) == 1:
+        return update_bytes
+
+    # The CRC register is XOR-ed into the next little endian word, which is
+    # then resolved with one lookup per byte
+    slice_by = len(tables)
+    if slice_by == 8:
+        t7, t6, t5, t4, t3, t2, t1, t0 = tables[::-1]
+    else:
+        t15, t14, t13, t12, t11, t10, t9, t8, \
+            t7, t6, t5, t4, t3, t2, t1, t0 = tables[::-1]
+
+    def update_sliced(crc, value):
+        view = _byte_view(value)
+        tail = len(view) - len(view) % slice_by
+
+        if slice_by == 8:
+            for words in _words(view[:tail], 'little'):
+                for word in words:
+                    v = crc ^ word
+                    crc = t7[v & 0xff] ^ t6[(v >> 8) & 0xff] ^ \
+                        t5[(v >> 16) & 0xff] ^ t4[(v >> 24) & 0xff] ^ \
+                        t3[(v >> 32) & 0xff] ^ t2[(v >> 40) & 0xff] ^ \
+                        t1[(v >> 48) & 0xff] ^ t0[v >> 56]
+        else:
+            for words in _words(view[:tail], 'little'):
+                it = iter(words)
+                for word, next_word in zip(it, it):
+                    v = crc ^ word
+                    crc = t15[v & 0xff] ^ t14[(v >> 8) & 0xff] ^ \
+                        t13[(v >> 16) & 0xff] ^ t12[(v >> 24) & 0xff] ^ \
+                        t11[(v >> 32) & 0xff] ^ t10[(v >> 40) & 0xff] ^ \
+                        t9[(v >> 48) & 0xff] ^ t8[v >> 56] ^ \
+                        t7[next_word & 0xff] ^ t6[(next_word >> 8) & 0xff] ^ \
+                        t5[(next_word >> 16) & 0xff] ^ t4[(next_word >> 24) & 0xff] ^ \
+                        t3[(next_word >> 32) & 0xff] ^ t2[(next_word >> 40) & 0xff] ^ \
+                        t1[(next_word >> 48) & 0xff] ^ t0[next_word >> 56]
+
+        # The remaining bytes are processed one by one
+        return update_bytes(crc, view[tail:])
+
+    return update_sliced
+
+
+def _normal_engine(tables, width, align):
+    """Build the update function of a non-reflected register. The register
+    is left-aligned to whole bytes by ``align`` bits while the input runs
+    through the table, see :func:`table_parameters`.
+    Args:
+        tables (tuple): Lookup tables like for :func:`_reflected_engine`
+        width (int): Width of the left-aligned register
+        align (int): Number of bits the register is shifted left
+    Returns:
+        callable - ``update(crc, value)``, returning the updated register
+    """
+    tables = tuple(tuple(table) for table in tables)
+    table = tables[0]
+    mask = (1 << width) - 1
+    shift = width - 8
+
+    def update_bytes(crc, value):
+        crc <<= align
+        for cur_byte in value:
+            crc = ((crc << 8) & mask) ^ table[(crc >> shift) ^ cur_byte]
+        return crc >> align
+
+    if len(tables) == 1:
+        return update_bytes
+
+    # The CRC register is aligned to the MSB of the next big endian word,
+    # which is then resolved with one lookup per byte
+    slice_by = len(tables)
+    word_shift = 64 - width
+    if slice_by == 8:
+        t7, t6, t5, t4, t3, t2, t1, t0 = tables[::-1]
+    else:
+        t15, t14, t13, t12, t11, t10, t9, t8, \
+            t7, t6, t5, t4, t3, t2, t1, t0 = tables[::-1]
+
+    def update_sliced(crc, value):
+        view = _byte_view(value)
+        tail = len(view) - len(view) % slice_by
+        crc <<= align
+
+        if slice_by == 8:
+            for words in _words(view[:tail], 'big'):
+                for word in words:
+                    v = (crc << word_shift) ^ word
+                    crc = t7[v >> 56] ^ t6[(v >> 48) & 0xff] ^ \
+                        t5[(v >> 40) & 0xff] ^ t4[(v >> 32) & 0xff] ^ \
+                        t3[(v >> 24) & 0xff] ^ t2[(v >> 16) & 0xff] ^ \
+                        t1[(v >> 8) & 0xff] ^ t0[v & 0xff]
+        else:
+            for words in _words(view[:tail], 'big'):
+                it = iter(words)
+                for word, next_word in zip(it, it):
+                    v = (crc << word_shift) ^ word
+                    crc = t15[v >> 56] ^ t14[(v >> 48) & 0xff] ^ \
+                        t13[(v >> 40) & 0xff] ^ t12[(v >> 32) & 0xff] ^ \
+                        t11[(v >> 24) & 0xff] ^ t10[(v >> 16) & 0xff] ^ \
+                        t9[(v >> 8) & 0xff] ^ t8[v & 0xff] ^ \
+                        t7[next_word >> 56] ^ t6[(next_word >> 48) & 0xff] ^ \
+                        t5[(next_word >> 40) & 0xff] ^ t4[(next_word >> 32) & 0xff] ^ \
+                        t3[(next_word >> 24) & 0xff] ^ t2[(next_word >> 16) & 0xff] ^ \
+                        t1[(next_word >> 8) & 0xff] ^ t0[next_word & 0xff]
+
+        # The remaining bytes are processed one by one
+        return update_bytes(crc >> align, view[tail:])
+
+    return update_sliced
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    """Import NumPy on first use, only :meth:`CRC_CALC.batch` needs it and it
+    takes long to import.
+    Returns:
+        module - :mod:`numpy`, None if it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        # NumPy is optional, batch() falls back to the scalar engine
+        return None
+
+    return numpy
+
+
+def _scatter_frames(joined, sizes, lengths):
+    """Scatter concatenated messages into the rows of a zero padded 2-D
+    ``uint8`` matrix without per-message Python work.
+    Args:
+        joined (numpy.ndarray): All messages, concatenated
+        sizes (numpy.ndarray): Size of every message in bytes
+        lengths: Number of valid bytes of every message, at most its size
+    Returns:
+        tuple - (matrix, lengths as ``intp`` array)
+    """
+    np = _numpy()
+    lengths = np.asarray(lengths, dtype=np.intp)
+    if lengths.shape != sizes.shape:
+        raise ValueError("Exactly one length per frame is required")
+    if np.any(lengths < 0) or np.any(lengths > sizes):
+        raise ValueError("Frame length out of range")
+
+    rows = sizes.shape[0]
+    width = int(lengths.max()) if rows else 0
+
+    if np.all(sizes == width) and np.all(lengths == width):
+        return joined.reshape(rows, width), lengths
+
+    total = int(lengths.sum())
+    data = np.zeros((rows, width), dtype=np.uint8)
+    # Row and column of every valid byte, and its offset in joined
+    row = np.repeat(np.arange(rows), lengths)
+    column = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    data[row, column] = joined[np.repeat(np.cumsum(sizes) - sizes, lengths) + column]
+
+    return data, lengths
 
 
 class CRC_CALC(object):
@@ -27,11 +676,13 @@ class CRC_CALC(object):
         final_xor_value (int): Value that will be XOR-ed with final checksum
         input_reflected (bool): True, if each input byte should be reflected
         result_reflected (bool): True, if the result should be reflected before the final XOR is applied
+        slice_by (int): Number of bytes consumed per step, ``1`` for the classic
+            byte-at-a-time engine, ``8`` or ``16`` for the slicing-by-N engine
     """
 
-    def __init__(self, width, polynomial, initial_value, final_xor_value, input_reflected, result_reflected):
-        assert 8 <= width <= 64
-        assert width % 8 == 0
+    def __init__(self, width, polynomial, initial_value, final_xor_value, input_reflected, result_reflected, slice_by=1):
+        assert 3 <= width <= 64
+        assert slice_by in (1, 8, 16)
 
         self._width = width
         self._polynomial = polynomial
@@ -39,6 +690,7 @@ class CRC_CALC(object):
         self._final_xor_value = final_xor_value
         self._input_reflected = input_reflected
         self._result_reflected = result_reflected
+        self._slice_by = slice_by
         self.__accumulate = initial_value
 
         # Initialize casting mask to keep the correct width for dynamic Python
@@ -49,128 +701,190 @@ class CRC_CALC(object):
         # number with given width
         self._msb_mask = 0x01 << (self._width - 1)
 
+        # Without the reflection optimization the table engines work on a
+        # register that is left-aligned to whole bytes, so that models of any
+        # width run the byte-aligned algorithms. The update function shifts the
+        # register in and out, for the rest of the class it stays right-aligned.
+        self.__register_width, self.__register_polynomial = table_parameters(
+            width, polynomial, input_reflected and result_reflected)
+        self.__align = self.__register_width - width
+        self.__register_mask = (1 << self.__register_width) - 1
+
         # The lookup tables get initialized lazzily. This ensures that only
-        # tables are calculated that are actually needed.
+        # tables are calculated that are actually needed. They are taken from
+        # the process wide cache and stay interned while the model uses them,
+        # see crc_tables() and table_registry().
         self.__table = None
         self.__reflected_table = None
+        self.__slicing_tables = None
+
+        # Update function specialized for this model, built on first use by
+        # _compile_engine()
+        self._engine = None
+
+        # Powers x^(2^k) mod polynomial, used to shift a CRC register over
+        # runs of zero bytes. They get extended lazily as well.
+        self.__x2n_table = [2 % ((1 << self._width) | self._polynomial)]
+
+    def __getstate__(self):
+        # The compiled engine is a closure and the tables may be views of a
+        # memory mapped table store, neither can be pickled. Both are
+        # acquired again lazily after unpickling.
+        state = self.__dict__.copy()
+        state['_engine'] = None
+        state['_CRC_CALC__table'] = None
+        state['_CRC_CALC__reflected_table'] = None
+        state['_CRC_CALC__slicing_tables'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def __get_table(self):
+        # Lazy initialization of the lookup table
+        if self.__table is None:
+            self.__table = _acquire_tables(
+                self, self.__register_width, self.__register_polynomial, False)[0]
+        return self.__table
 
-    def __reflect(self, num, width):
-        """Reverts bit order of the given number
-        Args:
-            num (int): Number that should be reflected
-            width (int): Size of the number in bits
-        """
-        reflected = 0
-
-        for i in range(width):
-            if (num >> i) & 1 != 0:
-                reflected |= 1 << (width - 1 - i)
-
-        return reflected
+    def __get_reflected_table(self):
+        # Lazy initialization of the lookup table
+        if self.__reflected_table is None:
+            self.__reflected_table = _acquire_tables(
+                self, self._width, self._polynomial, True)[0]
+        return self.__reflected_table
+
+    def __get_slicing_tables(self, reflected):
+        if self.__slicing_tables is None:
+            if reflected:
+                self.__slicing_tables = _acquire_tables(
+                    self, self._width, self._polynomial, True, self._slice_by)
+            else:
+                self.__slicing_tables = _acquire_tables(
+                    self, self.__register_width, self.__register_polynomial, False, self._slice_by)
+        return self.__slicing_tables
 
-    def __make_table(self, width):
-        """Create static sized CRC lookup table and initialize it with ``0``.
-        For 8, 16, 32, and 64 bit width :class:`array.array` instances are used. For
-        all other widths it falls back to a generic Python :class:`list`.
-        Args:
-            width (int): Size of elements in bits
-        """
-        initializer = (0 for _ in range(256))
-
-        if width <= 8:
-            return array.array('B', initializer)
-        elif width <= 16:
-            return array.array('H', initializer)
-        elif width <= 32:
-            return array.array('L', initializer)
-        elif width <= 64:
-            return array.array('Q', initializer)
+    def __repr__(self):
+        if self._input_reflected and self._result_reflected:
+            table = self.__get_reflected_table()
         else:
-            # Fallback to a generic list
-            return list(initializer)
+            table = self.__get_table()
 
-    def __calculate_crc_table(self):
-        table = self.__make_table(self._width)
-
-        for divident in range(256):
-            cur_byte = (divident << (self._width - 8)) & self._cast_mask
+        table = [table[i:i+8] for i in range(0, len(table), 8)]
+        table_str = [', '.join(
+            ["0x{:0{}X}".format(i, (self._width + 3) // 4) for i in t]
+        ) for t in table]
+        return ',\n'.join(table_str) + ','
 
-            for bit in range(8):
-                if (cur_byte & self._msb_mask) != 0:
-                    cur_byte <<= 1
-                    cur_byte ^= self._polynomial
-                else:
-                    cur_byte <<= 1
+    def _update(self, crc, value):
+        """Feed input bytes into a CRC register.
+        Args:
+            crc (int): Current CRC register, reflected if the model uses the
+                reflection optimization
+            value (bytes): Input bytes that should be checked
+        Returns:
+            int - Updated CRC register
+        """
+        engine = self._engine
+        if engine is None:
+            engine = self._engine = self._compile_engine()
 
-            table[divident] = cur_byte & self._cast_mask
+        return engine(crc, value)
 
-        return table
+    # The uninstrumented update, which stays available while a profile runs
+    _engine_update = _update
 
-    def __calculate_crc_table_reflected(self):
-        table = self.__make_table(self._width)
+    def _profiled_update(self, crc, value):
+        """Replaces :meth:`_update` on the class while a :class:`CRC_PROFILE`
+        is running, so the update path has no test while none is.
+        """
+        profiler = _profiler
+        if profiler is None:
+            # The profile stopped since this method was looked up
+            return self._engine_update(crc, value)
+
+        return profiler._update(self, crc, value)
+
+    def _compile_engine(self):
+        """Build the update function of the model. It is specialized for the
+        reflections and the table engine of the model, with tables and
+        constants bound as closure variables, so the loops neither test the
+        model parameters nor look up attributes. Subclasses with another
+        backend override this and :meth:`_engine_name`.
+        Returns:
+            callable - ``update(crc, value)`` like :meth:`_update`
+        """
+        if self._input_reflected:
+            if self._slice_by > 1:
+                tables = self.__get_slicing_tables(True)
+            else:
+                tables = (self.__get_reflected_table(),)
+            update = _reflected_engine(tables)
 
-        for divident in range(256):
-            reflected_divident = self.__reflect(divident, 8)
-            cur_byte = (reflected_divident << (
-                self._width - 8)) & self._cast_mask
-
-            for bit in range(8):
-                if (cur_byte & self._msb_mask) != 0:
-                    cur_byte <<= 1
-                    cur_byte ^= self._polynomial
-                else:
-                    cur_byte <<= 1
+            if self._result_reflected:
+                return update
 
-            cur_byte = self.__reflect(cur_byte, self._width)
+            # Instead of reflecting every input byte, the register is
+            # reflected on the way in and out of the reflected table engine
+            width = self._width
 
-            table[divident] = (cur_byte & self._cast_mask)
+            def update_reflected_input(crc, value):
+                return reflect(update(reflect(crc, width), value), width)
 
-        return table
+            return update_reflected_input
 
-    def __repr__(self):
-        if self._input_reflected and self._result_reflected:
-            if self.__reflected_table is None:
-                self.__reflected_table = self.__calculate_crc_table_reflected()
-            table = self.__reflected_table
+        if self._slice_by > 1:
+            tables = self.__get_slicing_tables(False)
         else:
-            if self.__table is None:
-                self.__table = self.__calculate_crc_table()
-            table = self.__table
+            tables = (self.__get_table(),)
 
-        table = [table[i:i+8] for i in range(0, len(table), 8)]
-        table_str = [', '.join(
-            ["0x{:0{}X}".format(i, self._width // 4) for i in t]
-        ) for t in table]
-        return ',\n'.join(table_str) + ','
+        return _normal_engine(tables, self.__register_width, self.__align)
 
-    def __fast_reflected(self, value):
-        """If the input data and the result checksum are both reflected in the
-        current model, an optimized algorithm can be used that reflects the
-        looup table rather then the input data. This saves the reflection
-        operation of the input data.
+    def _engine_name(self):
+        """Name of the code path :meth:`_engine_update` takes, as reported
+        by :class:`CRC_PROFILE`.
         """
-        if not self._input_reflected or not self._result_reflected:
-            raise ValueError("Input and result must be reflected")
+        if self._input_reflected:
+            return 'sliced_reflected' if self._slice_by > 1 else 'fast_reflected'
 
-        # Lazy initialization of the lookup table
-        if self.__reflected_table is None:
-            self.__reflected_table = self.__calculate_crc_table_reflected()
+        return 'sliced' if self._slice_by > 1 else 'generic'
 
-        crc = self._initial_value
+    def _profile_name(self):
+        """Name the counters of this model are reported under, see
+        :class:`CRC_PROFILE`. Models with equal names share their counters.
+        """
+        digits = (self._width + 3) // 4
+        return '({}, 0x{:0{digits}x}, 0x{:0{digits}x}, 0x{:0{digits}x}, {}, {})'.format(
+            self._width, self._polynomial, self._initial_value, self._final_xor_value,
+            self._input_reflected, self._result_reflected, digits=digits)
+
+    def _finalize(self, crc):
+        """Turn a CRC register returned by :meth:`_update` into the checksum.
+        The register itself is left untouched, so that it can be updated
+        further.
+        """
+        if self._result_reflected and not self._input_reflected:
+            crc = reflect(crc, self._width)
 
-        for cur_byte in value:
-            # The LSB of the XOR-red remainder and the next byte is the index
-            # into the lookup table
-            index = (crc & 0xff) ^ cur_byte
+        # Final XBOR
+        return crc ^ self._final_xor_value
 
-            # Shift out the index
-            crc = (crc >> 8) & self._cast_mask
+    def _unfinalize(self, crc):
+        """Inverse of :meth:`_finalize`, turns a checksum back into a CRC
+        register that can be updated further.
+        """
+        crc ^= self._final_xor_value
 
-            # XOR-ing remainder from the loopup table
-            crc = crc ^ self.__reflected_table[index]
+        if self._result_reflected and not self._input_reflected:
+            crc = reflect(crc, self._width)
 
-        # Final XBOR
-        return crc ^ self._final_xor_value
+        return crc
+
+    def _parameters(self):
+        """Constructor arguments, e.g. to rebuild the model in another process."""
+        return (self._width, self._polynomial, self._initial_value,
+                self._final_xor_value, self._input_reflected,
+                self._result_reflected, self._slice_by)
 
     def __call__(self, value):
         """Compute the CRC checksum with respect to the model parameters by using
@@ -180,91 +894,388 @@ class CRC_CALC(object):
         Returns:
             int - CRC checksum
         """
-        # Use the reflection optimization if applicable
-        if self._input_reflected and self._result_reflected:
-            return self.__fast_reflected(value)
+        return self._finalize(self._update(self._initial_value, value))
 
-        # Lazy initialization of the lookup table
-        if self.__table is None:
-            self.__table = self.__calculate_crc_table()
+    def accumulate(self, value):
+        self.__accumulate = self._update(self.__accumulate, value)
+        return self._finalize(self.__accumulate)
 
-        crc = self._initial_value
+    async def feed_stream(self, reader, chunk_size=ASYNC_CHUNK_SIZE, executor=None,
+                          inline_limit=ASYNC_INLINE_LIMIT):
+        """Compute the CRC checksum of everything read from an asyncio stream,
+        without blocking the event loop, see :meth:`CRC_HASH.feed_stream`.
+        Returns:
+            int - CRC checksum
+        """
+        return await self.new().feed_stream(reader, chunk_size, executor, inline_limit)
 
-        for cur_byte in value:
+    def new(self, data=None):
+        """Create an independent streaming hasher for this model, see
+        :class:`CRC_HASH`.
+        Args:
+            data (bytes): Optional initial input
+        """
+        return CRC_HASH(self, data)
+
+    def batch(self, frames, lengths=None):
+        """Compute the CRC checksums of many (short) messages at once. The
+        table lookups run column-wise across all messages, so the per-call
+        overhead is paid once per batch instead of once per message.
+        Args:
+            frames: Sequence of bytes-like messages, or 2-D ``uint8`` array
+                with one message per row
+            lengths (sequence of int): Optional number of valid bytes in each
+                message, at most its size; the remaining bytes are ignored
+        Returns:
+            numpy.ndarray - CRC checksums, a list of int if NumPy is not
+            installed
+        """
+        np = _numpy()
+        if np is None:
+            frames = [memoryview(frame).cast('B') for frame in frames]
+            if lengths is not None:
+                lengths = list(lengths)
+                if len(lengths) != len(frames):
+                    raise ValueError("Exactly one length per frame is required")
+                if not all(0 <= length <= len(frame)
+                           for frame, length in zip(frames, lengths)):
+                    raise ValueError("Frame length out of range")
+                frames = [frame[:length] for frame, length in zip(frames, lengths)]
+            return [self(frame) for frame in frames]
+
+        data, lengths = self.__batch_matrix(frames, lengths)
+        dtype = self.__batch_dtype()
+        crc = np.full(data.shape[0], self._initial_value << self.__align, dtype=dtype)
+
+        if data.shape[0] == 0:
+            return crc
+
+        # Process the longest messages first, so that the messages that are
+        # still active in a column are always a prefix of the rows
+        order = np.argsort(-lengths, kind='stable')
+        data = data[order]
+        active = np.searchsorted(-lengths[order], -np.arange(data.shape[1]),
+                                 side='left')
+
+        reflected = self._input_reflected and self._result_reflected
+        if reflected:
+            table = np.asarray(self.__get_reflected_table(), dtype=dtype)
+        else:
+            table = np.asarray(self.__get_table(), dtype=dtype)
             if self._input_reflected:
-                cur_byte = self.__reflect(cur_byte, 8)
+                data = np.asarray(bytearray(_BYTE_REFLECTION),
+                                  dtype=np.uint8)[data]
+
+        mask = dtype.type(self.__register_mask)
+        # Only used by the left-aligned register, that has at least 8 bits
+        shift = dtype.type(max(self.__register_width - 8, 0))
+        eight = dtype.type(8)
+
+        for column in range(data.shape[1]):
+            rows = active[column]
+            cur_crc = crc[:rows]
+            cur_byte = data[:rows, column]
+
+            if reflected:
+                index = (cur_crc ^ cur_byte) & 0xff
+                crc[:rows] = (cur_crc >> eight) ^ table[index]
+            else:
+                index = ((cur_crc >> shift) ^ cur_byte) & 0xff
+                crc[:rows] = ((cur_crc << eight) & mask) ^ table[index]
+
+        crc >>= dtype.type(self.__align)
+
+        if self._result_reflected and not reflected:
+            reflected_crc = np.zeros_like(crc)
+            for bit in range(self._width):
+                reflected_crc |= ((crc >> dtype.type(bit)) & 1) << \
+                    dtype.type(self._width - 1 - bit)
+            crc = reflected_crc
+
+        result = np.empty_like(crc)
+        result[order] = crc ^ dtype.type(self._final_xor_value)
+        return result
+
+    def __batch_dtype(self):
+        np = _numpy()
+        if self._width <= 8:
+            return np.dtype(np.uint8)
+        elif self._width <= 16:
+            return np.dtype(np.uint16)
+        elif self._width <= 32:
+            return np.dtype(np.uint32)
+        else:
+            return np.dtype(np.uint64)
+
+    def __batch_matrix(self, frames, lengths):
+        """Bring the input of :meth:`batch` into the shape of a 2-D ``uint8``
+        matrix and a length for every row.
+        """
+        np = _numpy()
+        if isinstance(frames, np.ndarray):
+            if frames.ndim != 2:
+                raise ValueError("Frames must be a 2-D array")
+            data = np.ascontiguousarray(frames, dtype=np.uint8)
+            if lengths is None:
+                lengths = np.full(data.shape[0], data.shape[1], dtype=np.intp)
+        else:
+            if not isinstance(frames, (list, tuple)):
+                frames = list(frames)
+            # One join and one pass of len() instead of per-frame conversions
+            joined = np.frombuffer(b''.join(frames), dtype=np.uint8)
+            sizes = np.fromiter(map(len, frames), dtype=np.intp, count=len(frames))
+            if sizes.sum() != joined.size:
+                # len() counts items of another size than bytes
+                sizes = np.fromiter((memoryview(frame).nbytes for frame in frames),
+                                    dtype=np.intp, count=len(frames))
+            return _scatter_frames(joined, sizes, sizes if lengths is None else lengths)
+
+        lengths = np.asarray(lengths, dtype=np.intp)
+        if lengths.shape != (data.shape[0],):
+            raise ValueError("Exactly one length per frame is required")
+        if np.any(lengths < 0) or np.any(lengths > data.shape[1]):
+            raise ValueError("Frame length out of range")
+
+        return data, lengths
+
+    def __multmodp(self, a, b):
+        """Multiply two polynomials modulo the CRC polynomial in GF(2).
+        Args:
+            a (int): Polynomial of degree less than ``width``
+            b (int): Polynomial of degree less than ``width``
+        """
+        product = 0
+
+        for bit in range(b.bit_length() - 1, -1, -1):
+            product <<= 1
+            if product & (1 << self._width):
+                product ^= self._polynomial | (1 << self._width)
+            if (b >> bit) & 1:
+                product ^= a
 
-            # Update the MSB of the CRC value with the next input byte
-            crc = (crc ^ (cur_byte << (self._width - 8))) & self._cast_mask
+        return product
 
-            # This MSB byte value is the index into the lookup table
-            index = (crc >> (self._width - 8)) & 0xff
+    def _xnmodp(self, n):
+        """Return ``x^n`` modulo the CRC polynomial in the non-reflected
+        domain. ``x^(8 * n)`` is the operator that appends ``n`` zero bytes to
+        a CRC register, other powers serve as folding constants.
+        """
+        table = self.__x2n_table
+        if len(table) < n.bit_length():
+            # Extend a copy and publish it by assignment, the table is shared
+            # by all threads using the model
+            table = list(table)
+            while len(table) < n.bit_length():
+                table.append(self.__multmodp(table[-1], table[-1]))
+            self.__x2n_table = table
+
+        power = 1
+        k = 0
+
+        while n:
+            if n & 1:
+                power = self.__multmodp(power, table[k])
+
+            n >>= 1
+            k += 1
+
+        return power
+
+    def __to_register(self, crc):
+        """Undo the final XOR and the result reflection. The returned register
+        is in the non-reflected domain for every model.
+        """
+        crc ^= self._final_xor_value
 
-            # Shift out the index
-            crc = (crc << 8) & self._cast_mask
+        if self._result_reflected:
+            crc = reflect(crc, self._width)
 
-            # XOR-ing crc from the lookup table using the calculated index
-            crc = crc ^ self.__table[index]
+        return crc
 
+    def __from_register(self, register):
+        """Inverse of :meth:`__to_register`."""
         if self._result_reflected:
-            crc = self.__reflect(crc, self._width)
+            register = reflect(register, self._width)
 
-        # Final XBOR
-        return crc ^ self._final_xor_value
+        return register ^ self._final_xor_value
 
-    def __fast_reflected_acc(self, value):
-        if not self._input_reflected or not self._result_reflected:
-            raise ValueError("Input and result must be reflected")
+    def __initial_register(self):
+        """Initial value in the non-reflected domain. The reflection
+        optimization loads the initial value into the reflected register as is.
+        """
+        if self._input_reflected and self._result_reflected:
+            return reflect(self._initial_value, self._width)
 
-        # Lazy initialization of the lookup table
-        if self.__reflected_table is None:
-            self.__reflected_table = self.__calculate_crc_table_reflected()
+        return self._initial_value
 
-        for cur_byte in value:
-            # The LSB of the XOR-red remainder and the next byte is the index
-            # into the lookup table
-            index = (self.__accumulate & 0xff) ^ cur_byte
+    def combine(self, crc_a, crc_b, len_b):
+        """Compute the CRC checksum of the concatenation ``A + B`` from the
+        checksums of both parts, like zlib's ``crc32_combine``. The runtime is
+        logarithmic in ``len_b``, the data itself is not needed.
+        Args:
+            crc_a (int): CRC checksum of the first part
+            crc_b (int): CRC checksum of the second part
+            len_b (int): Length of the second part in bytes
+        Returns:
+            int - CRC checksum of the concatenated data
+        """
+        if len_b < 0:
+            raise ValueError("Length must not be negative")
 
-            # Shift out the index
-            self.__accumulate = (self.__accumulate >> 8) & self._cast_mask
+        register_a = self.__to_register(crc_a) ^ self.__initial_register()
+        register_b = self.__to_register(crc_b)
 
-            # XOR-ing remainder from the loopup table
-            self.__accumulate = self.__accumulate ^ self.__reflected_table[index]
+        register = self.__multmodp(
+            register_a, self._xnmodp(8 * len_b)) ^ register_b
 
-        # Final XBOR
-        return self.__accumulate ^ self._final_xor_value
+        return self.__from_register(register)
 
-    def accumulate(self, value):
-        # Use the reflection optimization if applicable
-        if self._input_reflected and self._result_reflected:
-            return self.__fast_reflected_acc(value)
+    def uncombine(self, crc_ab, crc_a, len_b):
+        """Inverse of :meth:`combine`: compute the CRC checksum of ``B`` from
+        the checksums of ``A + B`` and ``A``.
+        Args:
+            crc_ab (int): CRC checksum of the concatenated data
+            crc_a (int): CRC checksum of the first part
+            len_b (int): Length of the second part in bytes
+        Returns:
+            int - CRC checksum of the second part
+        """
+        if len_b < 0:
+            raise ValueError("Length must not be negative")
 
-        # Lazy initialization of the lookup table
-        if self.__table is None:
-            self.__table = self.__calculate_crc_table()
+        register_a = self.__to_register(crc_a) ^ self.__initial_register()
+        register = self.__multmodp(
+            register_a, self._xnmodp(8 * len_b)) ^ self.__to_register(crc_ab)
 
-        for cur_byte in value:
-            if self._input_reflected:
-                cur_byte = self.__reflect(cur_byte, 8)
+        return self.__from_register(register)
 
-            # Update the MSB of the CRC value with the next input byte
-            self.__accumulate = (self.__accumulate ^ (
-                cur_byte << (self._width - 8))) & self._cast_mask
+    def index(self, path, interval=INDEX_INTERVAL, index_path=None):
+        """Open or build the checkpoint index of an append-only file and bring
+        it up to date, see :class:`CRC_INDEX`.
+        """
+        crc_index = CRC_INDEX(self, path, interval, index_path)
+        crc_index.update()
+        return crc_index
+
+    def __zero_register(self, value):
+        """CRC register of ``value`` for zero initial value, in the
+        non-reflected domain. Thanks to linearity, it is the contribution of
+        ``value`` to the register of any message it is part of.
+        """
+        register = self._update(0, value)
 
-            # This MSB byte value is the index into the lookup table
-            index = (self.__accumulate >> (self._width - 8)) & 0xff
+        if self._input_reflected and self._result_reflected:
+            register = reflect(register, self._width)
 
-            # Shift out the index
-            self.__accumulate = (self.__accumulate << 8) & self._cast_mask
+        return register
 
-            # XOR-ing crc from the lookup table using the calculated index
-            self.__accumulate = self.__accumulate ^ self.__table[index]
+    def update_patch(self, old_crc, total_len, offset, old_bytes, new_bytes):
+        """Compute the CRC checksum of a buffer after some of its bytes were
+        replaced, from the checksum before. The CRC is linear, the change of
+        the checksum is the zero-init CRC of the XOR difference shifted over
+        the bytes that follow the patch. The runtime is linear in the patch
+        size and logarithmic in ``total_len``.
+        Args:
+            old_crc (int): CRC checksum of the buffer before the patch
+            total_len (int): Length of the buffer in bytes
+            offset (int): Position of the patch
+            old_bytes (bytes): Bytes at ``offset`` before the patch
+            new_bytes (bytes): Bytes at ``offset`` after the patch
+        Returns:
+            int - CRC checksum of the patched buffer
+        """
+        if len(old_bytes) != len(new_bytes):
+            raise ValueError("Patch must not change the length")
+        if offset < 0 or offset + len(new_bytes) > total_len:
+            raise ValueError("Patch exceeds the buffer")
+
+        delta = bytes(a ^ b for a, b in zip(bytes(old_bytes), bytes(new_bytes)))
+        register = self.__multmodp(
+            self.__zero_register(delta), self._xnmodp(8 * (total_len - offset - len(delta))))
 
         if self._result_reflected:
-            self.__accumulate = self.__reflect(self.__accumulate, self._width)
+            register = reflect(register, self._width)
 
-        # Final XBOR
-        return self.__accumulate ^ self._final_xor_value
+        return old_crc ^ register
+
+    def __forge_patch(self, crc, total_len, offset, current):
+        """Return the bytes that replace ``current`` at ``offset`` and turn
+        the checksum ``crc`` into ``target``, see :meth:`forge`.
+        """
+        # Each bit of the patch flips a fixed set of checksum bits, solve the
+        # width x width linear system for the requested change
+        shift = self._xnmodp(8 * (total_len - offset - len(current)))
+        columns = []
+        for bit in range(8 * len(current)):
+            unit = (1 << bit).to_bytes(len(current), 'little')
+            column = self.__multmodp(self.__zero_register(unit), shift)
+            if self._result_reflected:
+                column = reflect(column, self._width)
+            columns.append(column)
+
+        rows = []
+        for k in range(self._width):
+            coefficients = 0
+            for bit, column in enumerate(columns):
+                coefficients |= (column >> k & 1) << bit
+            rows.append((coefficients, crc >> k & 1))
+
+        delta = _solve_gf2(rows)
+        if delta is None:
+            raise ValueError("No patch at this offset can reach the target")
+
+        delta = delta.to_bytes(len(current), 'little')
+        return bytes(a ^ b for a, b in zip(bytes(current), delta))
+
+    def forge(self, data, offset, target):
+        """Compute the patch bytes that make the checksum of ``data`` equal to
+        ``target`` when they are written at ``offset``. The patch has
+        ``ceil(width / 8)`` bytes and replaces the bytes at that position.
+        It is solved as linear system over GF(2), so the data is read only
+        once and nothing is brute forced.
+        Args:
+            data (bytes): Input bytes
+            offset (int): Position of the patch
+            target (int): Requested CRC checksum
+        Returns:
+            bytes - Patch, ``data[:offset] + patch + data[offset + len(patch):]``
+            has the checksum ``target``
+        """
+        size = (self._width + 7) // 8
+        if offset < 0 or offset + size > len(data):
+            raise ValueError("Patch exceeds the data")
+
+        return self.__forge_patch(self(data) ^ target, len(data), offset,
+                                  data[offset:offset + size])
+
+    def forge_file(self, path, offset, target):
+        """Like :meth:`forge`, but patch a file in place. The file is memory
+        mapped, it is never loaded as a whole.
+        Args:
+            path (str): File to patch
+            offset (int): Position of the patch
+            target (int): Requested CRC checksum
+        Returns:
+            bytes - Patch that was written
+        """
+        size = (self._width + 7) // 8
+
+        with open(path, 'r+b') as f_obj:
+            with mmap.mmap(f_obj.fileno(), 0) as f_map:
+                if offset < 0 or offset + size > len(f_map):
+                    raise ValueError("Patch exceeds the file")
+
+                view = memoryview(f_map)
+                try:
+                    patch = self.__forge_patch(self(view) ^ target, len(f_map), offset,
+                                               f_map[offset:offset + size])
+                finally:
+                    view.release()
+
+                f_map[offset:offset + size] = patch
+                f_map.flush()
+
+        return patch
 
     def reset(self):
         self.__accumulate = self._initial_value
@@ -272,7 +1283,551 @@ class CRC_CALC(object):
     def get(self):
         crc = self.__accumulate
         # self.reset()
-        return crc ^ self._final_xor_value
+        return self._finalize(crc)
+
+
+class CRC_HASH(object):
+    """Streaming CRC calculation with a :mod:`hashlib` like interface. Only
+    the running register is stored per stream, the lookup tables are shared
+    with the model, so many concurrent streams are cheap.
+    Args:
+        model (CRC_CALC): CRC model the stream is based on
+        data (bytes): Optional initial input
+    """
+
+    __slots__ = ('_model', '_crc')
+
+    def __init__(self, model, data=None):
+        self._model = model
+        self._crc = model._initial_value
+
+        if data is not None:
+            self.update(data)
+
+    @property
+    def name(self):
+        return getattr(self._model, '_algorithm', 'crc{}'.format(self._model._width))
+
+    @property
+    def digest_size(self):
+        return (self._model._width + 7) // 8
+
+    @property
+    def crcvalue(self):
+        """Current CRC checksum as integer."""
+        return self._model._finalize(self._crc)
+
+    def update(self, data):
+        """Feed more input into the stream.
+        Args:
+            data: Any object supporting the buffer protocol (bytes, bytearray,
+                memoryview, mmap, array, ...), it is not copied
+        """
+        self._crc = self._model._update(self._crc, memoryview(data).cast('B'))
+
+    def digest(self):
+        """Current CRC checksum as big endian bytes."""
+        return self.crcvalue.to_bytes(self.digest_size, 'big')
+
+    def hexdigest(self):
+        """Current CRC checksum as hexadecimal string."""
+        return '{:0{}x}'.format(self.crcvalue, self.digest_size * 2)
+
+    def copy(self):
+        """Return an independent copy of the stream."""
+        other = CRC_HASH.__new__(CRC_HASH)
+        other._model = self._model
+        other._crc = self._crc
+        return other
+
+    async def update_async(self, data, executor=None, inline_limit=ASYNC_INLINE_LIMIT):
+        """Like :meth:`update`, but the event loop keeps running while larger
+        buffers are checksummed.
+        Args:
+            data: Any object supporting the buffer protocol
+            executor (concurrent.futures.Executor): Executor for buffers larger
+                than ``inline_limit``. A process pool checksums the buffer in
+                isolation, the result is merged with :meth:`CRC_CALC.combine`.
+                Without an executor larger buffers are checksummed inline in
+                slices of ``inline_limit`` bytes, yielding to the event loop
+                after every slice; a thread would hold the GIL all the same.
+            inline_limit (int): Buffers up to this size are checksummed inline
+                in one go
+        """
+        # Imported here, it is slow to import and only needed by async callers
+        import asyncio
+
+        view = memoryview(data).cast('B')
+
+        if executor is None or len(view) <= inline_limit:
+            step = max(inline_limit, 1)
+            for offset in range(0, len(view) or 1, step):
+                self.update(view[offset:offset + step])
+                # Give other tasks a chance to run between two slices
+                await asyncio.sleep(0)
+            return
+
+        loop = asyncio.get_running_loop()
+
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            crc = await loop.run_in_executor(
+                executor, _checksum, self._model._parameters(), bytes(view))
+            crc = self._model.combine(self.crcvalue, crc, len(view))
+            self._crc = self._model._unfinalize(crc)
+        else:
+            self._crc = await loop.run_in_executor(
+                executor, self._model._update, self._crc, view)
+
+    async def iter_stream(self, source, chunk_size=ASYNC_CHUNK_SIZE, executor=None,
+                          inline_limit=ASYNC_INLINE_LIMIT):
+        """Asynchronous iterator that passes the chunks of ``source`` through
+        and feeds them into this stream on the way, e.g. to checksum an upload
+        while it is written to disk.
+        Args:
+            source: :class:`asyncio.StreamReader` (or any object with an
+                awaitable ``read(n)``), or an asynchronous iterable of buffers
+            chunk_size (int): Number of bytes requested per read
+            executor, inline_limit: See :meth:`update_async`
+        """
+        if hasattr(source, 'read'):
+            while True:
+                chunk = await source.read(chunk_size)
+                if not chunk:
+                    break
+                await self.update_async(chunk, executor, inline_limit)
+                yield chunk
+        else:
+            async for chunk in source:
+                await self.update_async(chunk, executor, inline_limit)
+                yield chunk
+
+    async def feed_stream(self, source, chunk_size=ASYNC_CHUNK_SIZE, executor=None,
+                          inline_limit=ASYNC_INLINE_LIMIT):
+        """Feed everything read from ``source`` into this stream, see
+        :meth:`iter_stream` for the arguments.
+        Returns:
+            int - CRC checksum of all input of the stream so far, like
+            :meth:`CRC_CALC.feed_stream`
+        """
+        async for _ in self.iter_stream(source, chunk_size, executor, inline_limit):
+            pass
+
+        return self.crcvalue
+
+
+class CRC_INDEX(object):
+    """Checkpoint index of an append-only file. The checksum of every prefix
+    of ``interval`` bytes multiples is kept in a sidecar file: a fixed header
+    followed by an array of little-endian 64 bit values, that can be memory
+    mapped. The checksum of any byte range is derived from the two nearest
+    checkpoints with :meth:`CRC_CALC.combine` and
+    :meth:`CRC_CALC.uncombine`, reading at most ``2 * interval`` bytes
+    independent of the file size.
+    Args:
+        model (CRC_CALC): CRC model
+        path (str): Indexed file
+        interval (int): Distance of the checkpoints in bytes. An existing
+            sidecar keeps its own interval.
+        index_path (str): Sidecar file, ``path`` + :data:`INDEX_SUFFIX` by
+            default
+    """
+
+    def __init__(self, model, path, interval=INDEX_INTERVAL, index_path=None):
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+
+        self._model = model
+        self._path = path
+        self._index_path = index_path or path + INDEX_SUFFIX
+        self._interval = interval
+        self._checkpoints = array.array('Q')
+        self.__load()
+
+    def __parameters(self):
+        model = self._model
+        return (model._width, bool(model._input_reflected), bool(model._result_reflected),
+                model._polynomial, model._initial_value, model._final_xor_value)
+
+    def __load(self):
+        try:
+            with open(self._index_path, 'rb') as f_obj:
+                header = f_obj.read(_INDEX_HEADER.size)
+                if len(header) < _INDEX_HEADER.size:
+                    return
+                magic, version, width, refin, refout, polynomial, initial_value, \
+                    final_xor_value, interval, count = _INDEX_HEADER.unpack(header)
+                if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+                    return
+                # An index of another model is rebuilt
+                if (width, bool(refin), bool(refout), polynomial, initial_value,
+                        final_xor_value) != self.__parameters():
+                    return
+
+                checkpoints = array.array('Q')
+                checkpoints.fromfile(f_obj, count)
+        except (OSError, EOFError):
+            return
+
+        if sys.byteorder == 'big':
+            checkpoints.byteswap()
+
+        self._interval = interval
+        self._checkpoints = checkpoints
+
+    def __save(self, first):
+        """Write the checkpoints from index ``first`` on and the header. A
+        missing sidecar is written completely."""
+        if not os.path.exists(self._index_path):
+            first = 0
+
+        width, refin, refout, polynomial, initial_value, final_xor_value = self.__parameters()
+        header = _INDEX_HEADER.pack(
+            _INDEX_MAGIC, _INDEX_VERSION, width, refin, refout, polynomial,
+            initial_value, final_xor_value, self._interval, len(self._checkpoints))
+
+        entries = self._checkpoints[first:]
+        if sys.byteorder == 'big':
+            entries.byteswap()
+
+        with open(self._index_path, 'r+b' if first else 'wb') as f_obj:
+            f_obj.seek(_INDEX_HEADER.size + first * 8)
+            entries.tofile(f_obj)
+            f_obj.truncate()
+            # The header comes last, so that it never counts missing entries
+            f_obj.seek(0)
+            f_obj.write(header)
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def indexed_size(self):
+        """Number of bytes covered by checkpoints."""
+        return len(self._checkpoints) * self._interval
+
+    def update(self):
+        """Extend the index to the current file size. Only the data after the
+        last checkpoint is read, in bounded chunks. A file that shrank below
+        the indexed size is indexed from scratch.
+        Returns:
+            int - Number of new checkpoints
+        """
+        size = os.path.getsize(self._path)
+        if size < self.indexed_size:
+            self._checkpoints = array.array('Q')
+
+        first = len(self._checkpoints)
+        if first:
+            crc = self._checkpoints[-1]
+        else:
+            crc = self._model(b'')
+        register = self._model._unfinalize(crc)
+
+        with open(self._path, 'rb') as f_obj:
+            f_obj.seek(self.indexed_size)
+            for _ in range((size - self.indexed_size) // self._interval):
+                remaining = self._interval
+                while remaining:
+                    chunk = f_obj.read(min(remaining, _INDEX_READ_SIZE))
+                    if not chunk:
+                        raise OSError("File shrank while it was indexed: {}".format(self._path))
+                    register = self._model._update(register, chunk)
+                    remaining -= len(chunk)
+                self._checkpoints.append(self._model._finalize(register))
+
+        if len(self._checkpoints) != first or not os.path.exists(self._index_path):
+            self.__save(first)
+
+        return len(self._checkpoints) - first
+
+    def __prefix_crc(self, f_obj, end):
+        """Checksum of the first ``end`` bytes of the file."""
+        count = min(end // self._interval, len(self._checkpoints))
+        crc = self._checkpoints[count - 1] if count else self._model(b'')
+        start = count * self._interval
+
+        if end > start:
+            f_obj.seek(start)
+            register = self._model._unfinalize(self._model(b''))
+            remaining = end - start
+            while remaining:
+                chunk = f_obj.read(min(remaining, _INDEX_READ_SIZE))
+                if not chunk:
+                    raise ValueError("Range exceeds the file")
+                register = self._model._update(register, chunk)
+                remaining -= len(chunk)
+            crc = self._model.combine(crc, self._model._finalize(register), end - start)
+
+        return crc
+
+    def crc(self, start=0, end=None):
+        """Compute the CRC checksum of the byte range ``[start, end)`` of the
+        file. Ranges beyond the indexed size are fine, but read everything
+        after the last checkpoint, call :meth:`update` first for appended data.
+        Args:
+            start (int): First byte of the range
+            end (int): End of the range, the file size by default
+        Returns:
+            int - CRC checksum
+        """
+        if end is None:
+            end = os.path.getsize(self._path)
+        if not 0 <= start <= end:
+            raise ValueError("Invalid range")
+
+        with open(self._path, 'rb') as f_obj:
+            crc_end = self.__prefix_crc(f_obj, end)
+            crc_start = self.__prefix_crc(f_obj, start)
+
+        return self._model.uncombine(crc_end, crc_start, end - start)
+
+
+class CRC_PROFILE(object):
+    """Opt-in instrumentation of all CRC models of the process. While a
+    profile is running, every register update is counted per model, code path
+    (see :meth:`CRC_CALC._engine_name`) and calling function, together with
+    the bytes fed and the time spent. Table loads are timed per model, table
+    builds per table key. Starting the first profile swaps the instrumented
+    update method into :class:`CRC_CALC` and stopping the last one swaps it
+    out again, so without a running profile the update path is unchanged
+    and the hooks can stay in production code. Subclasses overriding
+    ``_update`` are not instrumented.
+    Profiles nest, the innermost running one gets all counts; they are
+    stopped in the reverse order they were started. Use it as context
+    manager for scoped profiling::
+
+        with CRC_PROFILE() as profile:
+            crc32(data)
+        print(profile.to_prometheus())
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def running(self):
+        """True, if this profile collects the counts right now."""
+        return _profiler is self
+
+    def start(self):
+        """Start collecting, the counts of an earlier run are kept."""
+        global _profiler
+
+        with _profile_lock:
+            if self in _profile_stack:
+                raise RuntimeError("Profile is already running")
+
+            _profile_stack.append(self)
+            _profiler = self
+            CRC_CALC._update = CRC_CALC._profiled_update
+
+        return self
+
+    def stop(self):
+        """Stop collecting and reactivate the profile that ran before. Nested
+        profiles must be stopped in the reverse order they were started.
+        """
+        global _profiler
+
+        with _profile_lock:
+            if self not in _profile_stack:
+                raise RuntimeError("Profile is not running")
+            if _profile_stack[-1] is not self:
+                raise RuntimeError("A profile started later is still running")
+
+            _profile_stack.pop()
+            if _profile_stack:
+                _profiler = _profile_stack[-1]
+            else:
+                CRC_CALC._update = CRC_CALC._engine_update
+                _profiler = None
+
+    def reset(self):
+        """Drop all counts."""
+        with self.__lock:
+            # (model, path, caller) -> [calls, bytes, seconds]
+            self.__updates = {}
+            # model -> [loads, seconds]
+            self.__loads = {}
+            # table key -> [builds, seconds]
+            self.__builds = {}
+            self.__start = time.perf_counter()
+
+    def _update(self, model, crc, value):
+        """Run the update function of ``model`` and count it."""
+        # Compile first, the table loads and builds are counted on their own
+        engine = model._engine
+        if engine is None:
+            engine = model._engine = model._compile_engine()
+
+        start = time.perf_counter()
+        crc = engine(crc, value)
+        seconds = time.perf_counter() - start
+
+        # Frame 0 is this method, frame 1 is CRC_CALC._profiled_update
+        caller = sys._getframe(2).f_code.co_name if hasattr(sys, '_getframe') else ''
+        key = (model._profile_name(), model._engine_name(), caller)
+        size = len(value)
+
+        with self.__lock:
+            counts = self.__updates.get(key)
+            if counts is None:
+                counts = self.__updates[key] = [0, 0, 0.0]
+            counts[0] += 1
+            counts[1] += size
+            counts[2] += seconds
+
+        return crc
+
+    def _tables_loaded(self, model, seconds):
+        with self.__lock:
+            counts = self.__loads.setdefault(model._profile_name(), [0, 0.0])
+            counts[0] += 1
+            counts[1] += seconds
+
+    def _table_built(self, key, seconds):
+        with self.__lock:
+            counts = self.__builds.setdefault(key, [0, 0.0])
+            counts[0] += 1
+            counts[1] += seconds
+
+    def __counts(self):
+        with self.__lock:
+            updates = sorted((key, tuple(counts)) for key, counts in self.__updates.items())
+            loads = sorted((name, tuple(counts)) for name, counts in self.__loads.items())
+            builds = sorted((key, tuple(counts)) for key, counts in self.__builds.items())
+            seconds = time.perf_counter() - self.__start
+
+        return updates, loads, builds, seconds
+
+    def snapshot(self):
+        """Return the current counts.
+        Returns:
+            dict - ``{"seconds", "models", "table_builds"}``. ``seconds`` is
+            the time since the last reset. ``models`` maps the model names to
+            their ``calls``, ``bytes``, ``seconds``, ``table_loads`` and
+            ``table_seconds``, with the update counts broken down by
+            ``paths`` and ``callers``. ``table_builds`` lists the computed
+            tables like :func:`table_registry`, the time of slicing tables
+            includes their byte table.
+        """
+        updates, loads, builds, seconds = self.__counts()
+        models = {}
+
+        def model_entry(name):
+            if name not in models:
+                models[name] = {
+                    "calls": 0,
+                    "bytes": 0,
+                    "seconds": 0.0,
+                    "table_loads": 0,
+                    "table_seconds": 0.0,
+                    "paths": {},
+                    "callers": {},
+                }
+            return models[name]
+
+        for (name, path, caller), (calls, size, elapsed) in updates:
+            model = model_entry(name)
+            for entry in (model,
+                          model["paths"].setdefault(path, {"calls": 0, "bytes": 0, "seconds": 0.0}),
+                          model["callers"].setdefault(caller, {"calls": 0, "bytes": 0, "seconds": 0.0})):
+                entry["calls"] += calls
+                entry["bytes"] += size
+                entry["seconds"] += elapsed
+
+        for name, (count, elapsed) in loads:
+            model = model_entry(name)
+            model["table_loads"] = count
+            model["table_seconds"] = elapsed
+
+        return {
+            "seconds": seconds,
+            "models": models,
+            "table_builds": [{
+                "width": width,
+                "polynomial": polynomial,
+                "reflected": reflected,
+                "count": count,
+                "builds": built,
+                "seconds": elapsed,
+            } for (width, polynomial, reflected, count), (built, elapsed) in builds],
+        }
+
+    def to_json(self, **kwargs):
+        """Return :meth:`snapshot` as JSON, ``kwargs`` go to :func:`json.dumps`."""
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix='crc'):
+        """Return the counts in the Prometheus text exposition format. Update
+        counts are labeled by model, path and caller, table loads by model and
+        table builds by the table key.
+        Args:
+            prefix (str): Prefix of the metric names
+        """
+        updates, loads, builds, _ = self.__counts()
+        updates = [((('model', name), ('path', path), ('caller', caller)), counts)
+                   for (name, path, caller), counts in updates]
+        loads = [((('model', name),), counts) for name, counts in loads]
+        builds = [((('width', width), ('polynomial', '0x{:x}'.format(polynomial)),
+                    ('reflected', int(reflected)), ('count', count)), counts)
+                  for (width, polynomial, reflected, count), counts in builds]
+
+        metrics = (
+            ('updates_total', "Number of CRC register updates", updates, 0),
+            ('bytes_total', "Number of bytes fed into CRC registers", updates, 1),
+            ('update_seconds_total', "Time spent updating CRC registers", updates, 2),
+            ('table_loads_total', "Number of lookup table loads", loads, 0),
+            ('table_load_seconds_total', "Time spent loading lookup tables", loads, 1),
+            ('table_builds_total', "Number of computed lookup tables", builds, 0),
+            ('table_build_seconds_total', "Time spent computing lookup tables", builds, 1),
+        )
+
+        lines = []
+        for name, description, samples, column in metrics:
+            name = '{}_{}'.format(prefix, name)
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} counter'.format(name))
+            for labels, counts in samples:
+                lines.append('{}{{{}}} {}'.format(name, ','.join(
+                    '{}="{}"'.format(key, _prometheus_escape(value)) for key, value in labels),
+                    counts[column]))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _prometheus_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def current_profile():
+    """Return the running :class:`CRC_PROFILE`, or None if profiling is off."""
+    return _profiler
+
+
+def _checksum(parameters, data):
+    """Checksum ``data`` with a model rebuilt from its parameters. Module level
+    function, so that it can be sent to a process pool.
+    """
+    return CRC_CALC(*parameters)(data)
+
+
+if os.environ.get(TABLE_STORE_ENV):
+    try:
+        load_table_store(os.environ[TABLE_STORE_ENV])
+    except (OSError, ValueError) as exc:
+        # A missing or damaged store must not break the import, the tables
+        # are simply computed as without a store
+        warnings.warn("Ignoring {} {!r}: {}".format(
+            TABLE_STORE_ENV, os.environ[TABLE_STORE_ENV], exc), RuntimeWarning)
 
 
 if __name__ == '__main__':
@@ -299,3 +1854,11 @@ if __name__ == '__main__':
     assert crc1 == crc2
     print(hex(val_a1), hex(val_a2), hex(val_a3), hex(crc1))
     print(hex(val_b1), hex(val_b2), hex(val_b3), hex(crc2))
+
+    # 已使用过的模型可以序列化，并在进程池中计算
+    import pickle
+
+    clone = pickle.loads(pickle.dumps(crc32))
+    assert clone(data1 + data2 + data3) == crc1
+    with concurrent.futures.ProcessPoolExecutor(1) as executor:
+        assert executor.submit(crc32, data1 + data2 + data3).result() == crc1
@@ -0,0 +1,289 @@
+#!/usr/bin/python
+"""Native CRC backend built from the generated C code.
+    Copyright (c) 2023-present SKB(skb666@qq.com)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import ctypes
+import hashlib
+import os
+import shutil
+import subprocess
+import sysconfig
+import tempfile
+import threading
+from crc_calc import reflect
+
+
+# Environment variable naming the directory the shared libraries are cached in
+NATIVE_CACHE_ENV = 'CRC_NATIVE_CACHE'
+
+# Default cache directory of the shared libraries
+NATIVE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'crc_native')
+
+# Table engine and hardware acceleration of the shared libraries
+NATIVE_ENGINE = 'slice8'
+NATIVE_ACCEL = True
+
+# Extra compiler flags of the shared libraries
+NATIVE_CFLAGS = ['-O2', '-shared', '-fPIC']
+
+_NUM_TYPES = {
+    8: ctypes.c_uint8,
+    16: ctypes.c_uint16,
+    32: ctypes.c_uint32,
+    64: ctypes.c_uint64,
+}
+
+# Loaded backends by (model parameters, engine, accel), None if the build failed
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class _Py_buffer(ctypes.Structure):
+    _fields_ = [
+        ('buf', ctypes.c_void_p),
+        ('obj', ctypes.c_void_p),
+        ('len', ctypes.c_ssize_t),
+        ('itemsize', ctypes.c_ssize_t),
+        ('readonly', ctypes.c_int),
+        ('ndim', ctypes.c_int),
+        ('format', ctypes.c_char_p),
+        ('shape', ctypes.c_void_p),
+        ('strides', ctypes.c_void_p),
+        ('suboffsets', ctypes.c_void_p),
+        ('internal', ctypes.c_void_p),
+    ]
+
+
+try:
+    _get_buffer = ctypes.pythonapi.PyObject_GetBuffer
+    _get_buffer.argtypes = [ctypes.py_object, ctypes.POINTER(_Py_buffer), ctypes.c_int]
+    _get_buffer.restype = ctypes.c_int
+    _release_buffer = ctypes.pythonapi.PyBuffer_Release
+    _release_buffer.argtypes = [ctypes.POINTER(_Py_buffer)]
+    _release_buffer.restype = None
+except AttributeError:
+    # No CPython buffer API, buffers other than bytes get copied
+    _get_buffer = None
+
+
+def _compiler():
+    """Return the C compiler command as list, or None if there is none."""
+    command = os.environ.get('CC') or sysconfig.get_config_var('CC') or 'cc'
+    command = command.split()
+
+    if shutil.which(command[0]) is None:
+        return None
+
+    return command
+
+
+def _cache_dir():
+    return os.environ.get(NATIVE_CACHE_ENV) or NATIVE_CACHE_DIR
+
+
+def build_native(model, engine=NATIVE_ENGINE, accel=NATIVE_ACCEL):
+    """Build a shared library from the C code generated for a model, see
+    :meth:`crc.CRC.generate_for_c`. Libraries are cached by the hash of the
+    generated sources, so that a model is compiled only once.
+    Args:
+        model (crc.CRC): Model to build
+        engine (str): Table engine of the generated code
+        accel (bool): Include the hardware accelerated update
+    Returns:
+        str - Path of the shared library
+    Raises:
+        OSError: No C compiler is available
+        subprocess.CalledProcessError: The compiler failed
+    """
+    compiler = _compiler()
+    if compiler is None:
+        raise OSError("No C compiler found")
+
+    alg_name = model._algorithm
+    cache_dir = _cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        model.generate_for_c(build_dir + "/", engine=engine, accel=accel)
+        source_dir = os.path.join(build_dir, "libcrc", alg_name, "crc")
+
+        digest = hashlib.sha1(' '.join(compiler + NATIVE_CFLAGS).encode())
+        for name in sorted(os.listdir(source_dir)):
+            with open(os.path.join(source_dir, name), "rb") as f_obj:
+                digest.update(name.encode() + b'\0' + f_obj.read())
+
+        library = os.path.join(cache_dir, "lib{}-{}{}".format(
+            alg_name, digest.hexdigest()[:16], sysconfig.get_config_var('SHLIB_SUFFIX') or '.so'))
+        if os.path.exists(library):
+            return library
+
+        output = os.path.join(build_dir, os.path.basename(library))
+        subprocess.run(compiler + NATIVE_CFLAGS + [
+            "-I", source_dir, "-o", output,
+            os.path.join(source_dir, alg_name + ".c"),
+        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        # Another process may build the same library concurrently
+        os.replace(output, library)
+
+    return library
+
+
+class NativeBackend(object):
+    """CRC register update of a model, running in a shared library built by
+    :func:`build_native`. Registers are exchanged in the domain of
+    :meth:`crc_calc.CRC_CALC._update`, so the backend can replace it.
+    Args:
+        model (crc.CRC): Model the library was built for
+        library (str): Path of the shared library
+    """
+
+    def __init__(self, model, library):
+        alg_name = model._algorithm
+        num_type = _NUM_TYPES[model._data_width]
+
+        class State(ctypes.Structure):
+            _fields_ = [
+                ('width', ctypes.c_uint8),
+                ('input_reflected', ctypes.c_uint8),
+                ('result_reflected', ctypes.c_uint8),
+                ('polynomial', num_type),
+                ('initial_value', num_type),
+                ('final_xor_value', num_type),
+                ('accumulate', num_type),
+                ('cast_mask', num_type),
+            ]
+
+        self._library = ctypes.CDLL(library)
+        self._state = State
+        self._accum = getattr(self._library, alg_name + "_accum")
+        self._accum.argtypes = [ctypes.POINTER(State), ctypes.c_void_p, ctypes.c_size_t]
+        self._accum.restype = num_type
+        self._accel_available = getattr(self._library, alg_name + "_accel_available")
+        self._accel_available.argtypes = []
+        self._accel_available.restype = ctypes.c_int
+
+        # The C code keeps the register reflected whenever the input is
+        # reflected, the Python engine only if the result is reflected as well.
+        # A non-reflected register of the C code is left-aligned to whole bytes.
+        self._width = model._width
+        self._reflect = model._input_reflected and not model._result_reflected
+        self._align = 0 if model._input_reflected else -model._width % 8
+        self.path = library
+
+    @property
+    def accel(self):
+        """True, if the library uses the hardware accelerated update."""
+        return bool(self._accel_available())
+
+    def __accum(self, crc, address, length):
+        # accum() only reads the register of the state
+        state = self._state()
+        state.accumulate = reflect(crc, self._width) if self._reflect else crc << self._align
+        self._accum(ctypes.byref(state), address, length)
+        crc = state.accumulate
+
+        return reflect(crc, self._width) if self._reflect else crc >> self._align
+
+    def update(self, crc, value):
+        """Feed input bytes into a CRC register, see
+        :meth:`crc_calc.CRC_CALC._update`. Buffers are passed to the library
+        without copying them.
+        """
+        if isinstance(value, bytes):
+            if not value:
+                return crc
+            return self.__accum(crc, value, len(value))
+
+        if _get_buffer is not None:
+            buffer = _Py_buffer()
+            try:
+                _get_buffer(value, ctypes.byref(buffer), 0)
+            except BufferError:
+                # Not contiguous, copy below
+                pass
+            else:
+                try:
+                    if buffer.len == 0:
+                        return crc
+                    return self.__accum(crc, buffer.buf, buffer.len)
+                finally:
+                    _release_buffer(ctypes.byref(buffer))
+
+        value = memoryview(value).tobytes()
+        return self.update(crc, value)
+
+
+def load_native(model, engine=NATIVE_ENGINE, accel=NATIVE_ACCEL):
+    """Return the native backend of a model, building the shared library on
+    first use. Backends are shared by all models with the same parameters.
+    Args:
+        model (crc.CRC): Model to load
+        engine (str): Table engine of the generated code
+        accel (bool): Include the hardware accelerated update
+    Returns:
+        NativeBackend - Loaded backend, or None if there is no C compiler or
+        the build failed. The caller falls back to pure Python then.
+    """
+    key = (model._algorithm, model._parameters()[:6], engine, accel)
+
+    with _backends_lock:
+        if key not in _backends:
+            try:
+                _backends[key] = NativeBackend(model, build_native(model, engine, accel))
+            except (OSError, subprocess.CalledProcessError):
+                _backends[key] = None
+
+        return _backends[key]
+
+
+if __name__ == '__main__':
+    import random
+    import time
+    from crc import CRC, crc_alg_table
+
+    # 对比所有参数模型的纯 Python 实现和本地实现
+    rng = random.Random(1234)
+    data = bytes(rng.getrandbits(8) for _ in range(4099))
+    lengths = [0, 1, 7, 8, 9, 15, 16, 17, 31, 32, 33, 100, 255, 256, 1000, 4099]
+    failed = []
+
+    for alg_name in crc_alg_table.keys():
+        soft = CRC(alg_name)
+        native = CRC(alg_name, native=True)
+        assert native.native, "{}: native backend not available".format(alg_name)
+
+        for length in lengths:
+            for value in (data[:length], bytearray(data[:length]), memoryview(data)[3:3 + length]):
+                if soft(value) != native(value):
+                    failed.append((alg_name, length, type(value).__name__))
+
+        for length in lengths:
+            assert soft.accumulate(data[:length]) == native.accumulate(data[:length])
+        assert soft.get() == native.get()
+
+        print("{:<24} ok".format(alg_name))
+
+    assert not failed, failed
+
+    # 速度对比
+    data = bytes(rng.getrandbits(8) for _ in range(1 << 20))
+    for alg_name in ("crc32", "crc32_c", "crc64_xz"):
+        for model in (CRC(alg_name, slice_by=16), CRC(alg_name, native=True)):
+            start = time.perf_counter()
+            model(data)
+            seconds = time.perf_counter() - start
+            print("{:<12} {:<7} {:10.1f} MB/s".format(
+                alg_name, "native" if model.native else "python", len(data) / seconds / 1e6))
@@ -0,0 +1,333 @@
+#!/usr/bin/python
+"""CRC model search over sample messages.
+    Copyright (c) 2023-present SKB(skb666@qq.com)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+        http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from crc import crc_alg_table
+from crc_calc import CRC_CALC, _BYTE_REFLECTION, _solve_gf2, reflect
+
+
+# Largest number of bits of the brute-force part of the polynomial search.
+# The search enumerates 2^(bits - 1) candidates.
+MAX_SEARCH_BITS = 24
+
+# Bound of the brute-force part when find_model() tries all widths. Without
+# it a single pair of equal-length messages means 2^(bits - 1) candidates for
+# every width up to MAX_SEARCH_BITS.
+AUTO_SEARCH_BITS = 12
+
+# Brute-force searches with fewer candidates run in the calling process
+POOL_MIN_CANDIDATES = 1 << 12
+
+# Number of candidates per task of the process pool
+POOL_CHUNK = 1 << 12
+
+
+def _gf2_mod(a, b):
+    """Remainder of the polynomial division ``a / b`` in GF(2)."""
+    degree = b.bit_length()
+
+    while a.bit_length() >= degree:
+        a ^= b << (a.bit_length() - degree)
+
+    return a
+
+
+def _gf2_div(a, b):
+    """Quotient of the polynomial division ``a / b`` in GF(2)."""
+    degree = b.bit_length()
+    quotient = 0
+
+    while a.bit_length() >= degree:
+        shift = a.bit_length() - degree
+        quotient |= 1 << shift
+        a ^= b << shift
+
+    return quotient
+
+
+def _gf2_gcd(a, b):
+    while b:
+        a, b = b, _gf2_mod(a, b)
+
+    return a
+
+
+def _gf2_mulmod(a, b, modulus):
+    """Product of two polynomials modulo ``modulus`` in GF(2)."""
+    product = 0
+
+    while b:
+        if b & 1:
+            product ^= a
+        b >>= 1
+        a = _gf2_mod(a << 1, modulus)
+
+    return _gf2_mod(product, modulus)
+
+
+def _reflect_bytes(data):
+    return bytes(data).translate(_BYTE_REFLECTION)
+
+
+def _divisors(dividend, degree, start, stop):
+    """Return the polynomials ``(1 << degree) | low`` with odd ``low`` in
+    ``range(start, stop)``, that divide ``dividend``. Module level function,
+    so that it can run in a process pool.
+    """
+    top = 1 << degree
+
+    return [top | low for low in range(start | 1, stop, 2)
+            if _gf2_mod(dividend, top | low) == 0]
+
+
+def _odd_divisors(dividend, degree, workers):
+    """Enumerate the divisors of ``dividend`` of the given degree, whose
+    constant term is set. Large searches are split across a process pool.
+    """
+    count = 1 << degree
+
+    if workers <= 1 or count < POOL_MIN_CANDIDATES:
+        return _divisors(dividend, degree, 0, count)
+
+    starts = list(range(0, count, POOL_CHUNK))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _divisors,
+            [dividend] * len(starts),
+            [degree] * len(starts),
+            starts,
+            [min(start + POOL_CHUNK, count) for start in starts],
+        )
+
+        return [divisor for result in results for divisor in result]
+
+
+def _candidate_polynomials(dividend, width, max_bits, workers):
+    """Return the polynomials of degree ``width`` with constant term, that
+    divide ``dividend``. Either the polynomial itself or its cofactor is
+    enumerated, whichever has the lower degree.
+    """
+    cofactor_degree = dividend.bit_length() - 1 - width
+
+    if cofactor_degree < 0:
+        return []
+
+    if cofactor_degree <= width and cofactor_degree <= max_bits:
+        # The constant term of a cofactor is set as well, unless the dividend
+        # has factors x, which no CRC polynomial has
+        while not dividend & 1:
+            dividend >>= 1
+            cofactor_degree -= 1
+            if cofactor_degree < 0:
+                return []
+
+        if cofactor_degree == 0:
+            return [dividend]
+
+        return sorted(_gf2_div(dividend, cofactor)
+                      for cofactor in _odd_divisors(dividend, cofactor_degree, workers))
+
+    if width <= max_bits:
+        return _odd_divisors(dividend, width, workers)
+
+    return []
+
+
+def _solve_init_xorout(samples, width, polynomial, input_reflected, result_reflected):
+    """Solve init and xorout of a model with known polynomial. With the
+    register of the non-reflected domain, a message of ``n`` bytes gives
+    ``refout(crc) ^ crc0(message) == init * x^(8n) ^ refout(xorout)``, that
+    is linear in init and xorout.
+    Returns:
+        tuple - (initial_value, final_xor_value) in the convention of
+        :class:`crc_calc.CRC_CALC`, or None if there is no solution
+    """
+    zero = CRC_CALC(width, polynomial, 0, 0, input_reflected, False)
+    modulus = (1 << width) | polynomial
+    equations = []
+
+    for data, crc in samples:
+        if result_reflected:
+            crc = reflect(crc, width)
+        # The zero model reflects the input bytes itself
+        equations.append((zero._xnmodp(8 * len(data)), crc ^ zero(data)))
+
+    shift_0, value_0 = equations[0]
+    rows = []
+    for shift, value in equations[1:]:
+        # Column j of the operator that maps init to the difference
+        columns = [_gf2_mulmod(1 << j, shift ^ shift_0, modulus) for j in range(width)]
+        rhs = value ^ value_0
+        for k in range(width):
+            coefficients = 0
+            for j in range(width):
+                coefficients |= (columns[j] >> k & 1) << j
+            rows.append((coefficients, rhs >> k & 1))
+
+    init = _solve_gf2(rows)
+    if init is None:
+        return None
+
+    xorout = _gf2_mulmod(init, shift_0, modulus) ^ value_0
+    if result_reflected:
+        xorout = reflect(xorout, width)
+
+    # The reflection optimization keeps the register reflected from the start
+    if input_reflected and result_reflected:
+        init = reflect(init, width)
+
+    return init, xorout
+
+
+def _matches(parameters, samples):
+    model = CRC_CALC(*parameters)
+    return all(model(data) == crc for data, crc in samples)
+
+
+def _search(samples, width, max_bits, workers):
+    """Search models of one width, see :func:`find_model`."""
+    by_length = {}
+    for data, crc in samples:
+        by_length.setdefault(len(data), []).append((bytes(data), crc))
+
+    found = []
+    for input_reflected in (False, True):
+        for result_reflected in (False, True):
+            # The difference of two messages of the same length does not
+            # depend on init and xorout, the CRC polynomial divides
+            # diff(x) * x^width + diff(crc)(x) for every such pair
+            dividend = 0
+            for group in by_length.values():
+                data_0, crc_0 = group[0]
+                for data, crc in group[1:]:
+                    diff = bytes(a ^ b for a, b in zip(data, data_0))
+                    if input_reflected:
+                        diff = _reflect_bytes(diff)
+                    crc ^= crc_0
+                    if result_reflected:
+                        crc = reflect(crc, width)
+                    dividend = _gf2_gcd(dividend, (int.from_bytes(diff, "big") << width) ^ crc)
+
+            if not dividend:
+                continue
+
+            for modulus in _candidate_polynomials(dividend, width, max_bits, workers):
+                polynomial = modulus ^ (1 << width)
+                solution = _solve_init_xorout(samples, width, polynomial, input_reflected, result_reflected)
+                if solution is None:
+                    continue
+
+                parameters = (width, polynomial) + solution + (input_reflected, result_reflected)
+                if _matches(parameters, samples):
+                    found.append(parameters)
+
+    return found
+
+
+def find_model(samples, width=None, search=True, max_bits=MAX_SEARCH_BITS, workers=None):
+    """Find the CRC models that produce the given checksums.
+    All known models of :data:`crc.crc_alg_table` are tested first. Then
+    unknown polynomials are searched in the style of CRC RevEng: the checksum
+    differences of messages of the same length do not depend on init and
+    xorout, so the polynomial divides the GCD of the corresponding GF(2)
+    polynomials and only the divisors of that GCD are enumerated. init and
+    xorout are solved as linear system.
+    Args:
+        samples (list): ``(data, crc)`` pairs, at least two messages of the
+            same length are needed to search for the polynomial
+        width (int): Width of the model, all widths that fit the checksums by
+            default. The brute-force part then enumerates divisors of at most
+            :data:`AUTO_SEARCH_BITS` bits, so give the width when the samples
+            only contain few messages of the same length.
+        search (bool): False, to only test the known models
+        max_bits (int): Upper bound for the degree of the enumerated divisors.
+            The search takes time in the order of ``2^(max_bits - 1)`` model
+            evaluations per width and reflection, e.g. seconds for 18 bits and
+            minutes for 24 bits on one CPU.
+        workers (int): Number of worker processes of the brute-force part,
+            defaults to the number of CPUs
+    Returns:
+        list - ``(name, parameters)`` tuples, ``name`` is the known model name
+        or None, ``parameters`` is a tuple like the values of
+        :data:`crc.crc_alg_table`. If the samples do not determine init (e.g.
+        all messages have the same length), init is reported as 0.
+    """
+    samples = [(bytes(data), crc) for data, crc in samples]
+    if not samples:
+        raise ValueError("No samples")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    bits = max(crc.bit_length() for _, crc in samples)
+    if width is None:
+        widths = list(range(max(bits, 3), 65))
+        max_bits = min(max_bits, AUTO_SEARCH_BITS)
+    else:
+        widths = [width]
+
+    results = []
+    for alg_name, parameters in crc_alg_table.items():
+        if parameters[0] in widths and _matches(parameters, samples):
+            results.append((alg_name, parameters))
+
+    if search:
+        known = set(parameters for _, parameters in results)
+        for w in widths:
+            for parameters in _search(samples, w, max_bits, workers):
+                if parameters not in known:
+                    known.add(parameters)
+                    results.append((None, parameters))
+
+    return results
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    rng = random.Random(2023)
+
+    # 已知参数模型
+    model = CRC_CALC(*crc_alg_table["crc16_modbus"])
+    samples = [(data, model(data)) for data in (b"123456789", b"hello world", b"\x01\x03\x00\x00\x00\x0a")]
+    print(find_model(samples, search=False))
+
+    # 未知参数模型，多项式含 (x+1) 等因子时可能存在等价的 init/xorout，
+    # 因此用新的报文验证找到的参数模型
+    for parameters in ((16, 0x8bb7, 0x1d0f, 0x0000, False, False),
+                       (16, 0x3d65, 0x0000, 0xffff, True, True),
+                       (32, 0x741b8cd7, 0xffffffff, 0x0, True, True),
+                       (16, 0x5935, 0x1234, 0x00ff, True, False)):
+        model = CRC_CALC(*parameters)
+        frames = [bytes(rng.getrandbits(8) for _ in range(length)) for length in (16, 16, 16, 24, 9, 31)]
+        samples = [(frame, model(frame)) for frame in frames]
+
+        start = time.perf_counter()
+        found = find_model(samples, width=parameters[0])
+        print("{:.2f} s".format(time.perf_counter() - start), found)
+
+        frames = [bytes(rng.getrandbits(8) for _ in range(length)) for length in (0, 3, 100)]
+        assert any(all(CRC_CALC(*p)(frame) == model(frame) for frame in frames) for _, p in found)
+
+    # 只有一对等长报文时需要枚举全部 16 位多项式
+    model = CRC_CALC(16, 0xc867, 0xffff, 0x0, False, False)
+    frames = [bytes(rng.getrandbits(8) for _ in range(8)) for _ in range(2)] + [b"123456789"]
+    samples = [(frame, model(frame)) for frame in frames]
+    start = time.perf_counter()
+    found = find_model(samples, width=16)
+    print("{:.2f} s".format(time.perf_counter() - start), found)
+    assert any(p == (16, 0xc867, 0xffff, 0x0, False, False) for _, p in found)
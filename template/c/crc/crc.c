@@ -24,10 +24,45 @@ const static {algorithm_upper} {algorithm}_default = {{
 #include {algorithm_upper}_DEFAULT_DATA
 }};
 
-const static {algorithm_upper}_NUM_TYPE {algorithm}_table[] = {{
+/* The combined libcrc.c defines tables shared by several models up front */
+#ifdef {algorithm_upper}_TABLE_SHARED
+#define {algorithm}_table {algorithm_upper}_TABLE_SHARED
+#elif {algorithm_upper}_TABLE_BITS == 4
+const static {algorithm_upper}_NUM_TYPE {algorithm}_table[16] = {{
 #include {algorithm_upper}_TABLE_DATA
 }};
-
+#elif {algorithm_upper}_SLICE_BY > 1
+const static {algorithm_upper}_NUM_TYPE {algorithm}_table[{algorithm_upper}_SLICE_BY][256] = {{
+#include {algorithm_upper}_TABLE_DATA
+}};
+#else
+const static {algorithm_upper}_NUM_TYPE {algorithm}_table[256] = {{
+#include {algorithm_upper}_TABLE_DATA
+}};
+#endif
+
+#if {algorithm_upper}_TABLE_BITS == 8 && {algorithm_upper}_SLICE_BY > 1
+#define {algorithm_upper}_TABLE0(index) {algorithm}_table[0][index]
+#else
+#define {algorithm_upper}_TABLE0(index) {algorithm}_table[index]
+#endif
+
+/* Byte k of the register, that is combined with input byte k of a block, and
+ * the register shifted by n bytes. Both fold to constants or plain shifts, the
+ * modulo only keeps the shift count of unused branches in range. */
+#if {algorithm_upper}_REFLECTED
+#define {algorithm_upper}_REG_BYTE(crc, k) \
+    ((k) * 8 < {algorithm_upper}_REG_WIDTH ? (uint8_t)((crc) >> (((k) * 8) % {algorithm_upper}_NUM_BITS)) : 0)
+#define {algorithm_upper}_REG_SHIFT(crc, n) \
+    ((n) * 8 < {algorithm_upper}_REG_WIDTH ? ({algorithm_upper}_NUM_TYPE)((crc) >> (((n) * 8) % {algorithm_upper}_NUM_BITS)) : 0)
+#else
+#define {algorithm_upper}_REG_BYTE(crc, k) \
+    ((k) * 8 < {algorithm_upper}_REG_WIDTH ? (uint8_t)((crc) >> (({algorithm_upper}_REG_WIDTH - 8 - (k) * 8 + {algorithm_upper}_NUM_BITS) % {algorithm_upper}_NUM_BITS)) : 0)
+#define {algorithm_upper}_REG_SHIFT(crc, n) \
+    ((n) * 8 < {algorithm_upper}_REG_WIDTH ? ({algorithm_upper}_NUM_TYPE)(((crc) << (((n) * 8) % {algorithm_upper}_NUM_BITS)) & {algorithm_upper}_CAST_MASK) : 0)
+#endif
+
+#if {algorithm_upper}_FINAL_REFLECT
 static {algorithm_upper}_NUM_TYPE {algorithm}_reverse_bits({algorithm_upper}_NUM_TYPE data, uint8_t width) {{
     {algorithm_upper}_NUM_TYPE result = 0;
 
@@ -39,104 +74,96 @@ static {algorithm_upper}_NUM_TYPE {algorithm}_reverse_bits({algorithm_upper}_NUM
 
     return result;
 }}
-
-void {algorithm}_init({algorithm_upper} *crc) {{
-    memcpy(crc, &{algorithm}_default, sizeof({algorithm_upper}));
-}}
-
-static {algorithm_upper}_NUM_TYPE {algorithm}_calc_reflect({algorithm_upper} *crc, void *data, size_t length) {{
-    uint8_t *value, index;
-    {algorithm_upper}_NUM_TYPE crc_val;
-
-    value = (uint8_t *)data;
-    crc_val = crc->initial_value;
-
-    for (size_t i = 0; i < length; ++value, ++i) {{
-        index = (crc_val & 0xFF) ^ (*value);
-        crc_val = (crc_val >> 8) & crc->cast_mask;
-        crc_val ^= {algorithm}_table[index];
+#endif
+
+static {algorithm_upper}_NUM_TYPE {algorithm}_update({algorithm_upper}_NUM_TYPE crc, const uint8_t *value, size_t length) {{
+#if {algorithm_upper}_TABLE_BITS == 4
+    for (; length; --length, ++value) {{
+#if {algorithm_upper}_REFLECTED
+        crc ^= *value;
+        crc = (crc >> 4) ^ {algorithm}_table[crc & 0x0F];
+        crc = (crc >> 4) ^ {algorithm}_table[crc & 0x0F];
+#else
+        crc ^= ({algorithm_upper}_NUM_TYPE)*value << ({algorithm_upper}_REG_WIDTH - 8);
+        crc = ((crc << 4) & {algorithm_upper}_CAST_MASK) ^ {algorithm}_table[(crc >> ({algorithm_upper}_REG_WIDTH - 4)) & 0x0F];
+        crc = ((crc << 4) & {algorithm_upper}_CAST_MASK) ^ {algorithm}_table[(crc >> ({algorithm_upper}_REG_WIDTH - 4)) & 0x0F];
+#endif
     }}
-
-    return crc_val ^ crc->final_xor_value;
-}}
-
-{algorithm_upper}_NUM_TYPE {algorithm}_calc({algorithm_upper} *crc, void *data, size_t length) {{
-    uint8_t *value, index;
-    {algorithm_upper}_NUM_TYPE crc_val, data_xor;
-
-    if (crc->input_reflected && crc->result_reflected) {{
-        return {algorithm}_calc_reflect(crc, data, length);
+#else
+#if {algorithm_upper}_SLICE_BY == 8
+    for (; length >= 8; length -= 8, value += 8) {{
+        crc = {algorithm_upper}_REG_SHIFT(crc, 8) ^
+              {algorithm}_table[7][value[0] ^ {algorithm_upper}_REG_BYTE(crc, 0)] ^
+              {algorithm}_table[6][value[1] ^ {algorithm_upper}_REG_BYTE(crc, 1)] ^
+              {algorithm}_table[5][value[2] ^ {algorithm_upper}_REG_BYTE(crc, 2)] ^
+              {algorithm}_table[4][value[3] ^ {algorithm_upper}_REG_BYTE(crc, 3)] ^
+              {algorithm}_table[3][value[4] ^ {algorithm_upper}_REG_BYTE(crc, 4)] ^
+              {algorithm}_table[2][value[5] ^ {algorithm_upper}_REG_BYTE(crc, 5)] ^
+              {algorithm}_table[1][value[6] ^ {algorithm_upper}_REG_BYTE(crc, 6)] ^
+              {algorithm}_table[0][value[7] ^ {algorithm_upper}_REG_BYTE(crc, 7)];
     }}
-
-    value = (uint8_t *)data;
-    crc_val = crc->initial_value;
-
-    for (size_t i = 0; i < length; ++value, ++i) {{
-        if (crc->input_reflected) {{
-            data_xor = {algorithm}_reverse_bits(*value, 8) & 0xFF;
-        }} else {{
-            data_xor = *value;
-        }}
-
-        crc_val = (crc_val ^ (data_xor << (crc->width - 8))) & crc->cast_mask;
-        index = (uint8_t)((crc_val >> (crc->width - 8)) & 0xFF);
-        crc_val = (crc_val << 8) & crc->cast_mask;
-        crc_val ^= {algorithm}_table[index];
+#elif {algorithm_upper}_SLICE_BY == 4
+    for (; length >= 4; length -= 4, value += 4) {{
+        crc = {algorithm_upper}_REG_SHIFT(crc, 4) ^
+              {algorithm}_table[3][value[0] ^ {algorithm_upper}_REG_BYTE(crc, 0)] ^
+              {algorithm}_table[2][value[1] ^ {algorithm_upper}_REG_BYTE(crc, 1)] ^
+              {algorithm}_table[1][value[2] ^ {algorithm_upper}_REG_BYTE(crc, 2)] ^
+              {algorithm}_table[0][value[3] ^ {algorithm_upper}_REG_BYTE(crc, 3)];
     }}
-
-    if (crc->result_reflected) {{
-        crc_val = {algorithm}_reverse_bits(crc_val, crc->width);
+#endif
+    for (; length; --length, ++value) {{
+        crc = {algorithm_upper}_REG_SHIFT(crc, 1) ^ {algorithm_upper}_TABLE0(*value ^ {algorithm_upper}_REG_BYTE(crc, 0));
     }}
+#endif
 
-    return crc_val ^ crc->final_xor_value;
+    return crc;
 }}
 
-static {algorithm_upper}_NUM_TYPE {algorithm}_accum_reflect({algorithm_upper} *crc, void *data, size_t length) {{
-    uint8_t *value, index;
+static {algorithm_upper}_NUM_TYPE {algorithm}_finalize({algorithm_upper}_NUM_TYPE crc) {{
+#if {algorithm_upper}_ALIGN
+    crc >>= {algorithm_upper}_ALIGN;
+#endif
+#if {algorithm_upper}_FINAL_REFLECT
+    crc = {algorithm}_reverse_bits(crc, {algorithm_upper}_WIDTH);
+#endif
 
-    value = (uint8_t *)data;
+    return crc ^ {algorithm_upper}_FINAL_XOR;
+}}
 
-    for (size_t i = 0; i < length; ++value, ++i) {{
-        index = (crc->accumulate & 0xFF) ^ (*value);
-        crc->accumulate = (crc->accumulate >> 8) & crc->cast_mask;
-        crc->accumulate ^= {algorithm}_table[index];
-    }}
+#if {algorithm_upper}_ACCEL
+#include {algorithm_upper}_ACCEL_CODE
+#else
+#define {algorithm}_update_accel {algorithm}_update
 
-    return crc->accumulate ^ crc->final_xor_value;
+int {algorithm}_accel_available(void) {{
+    return 0;
 }}
+#endif
 
-{algorithm_upper}_NUM_TYPE {algorithm}_accum({algorithm_upper} *crc, void *data, size_t length) {{
-    uint8_t *value, index;
-    {algorithm_upper}_NUM_TYPE data_xor;
+void {algorithm}_init({algorithm_upper} *crc) {{
+    memcpy(crc, &{algorithm}_default, sizeof({algorithm_upper}));
+}}
 
-    if (crc->input_reflected && crc->result_reflected) {{
-        return {algorithm}_accum_reflect(crc, data, length);
-    }}
+{algorithm_upper}_NUM_TYPE {algorithm}_calc({algorithm_upper} *crc, void *data, size_t length) {{
+    (void)crc;
 
-    value = (uint8_t *)data;
+    return {algorithm}_finalize({algorithm}_update_accel({algorithm_upper}_INIT_REGISTER, (const uint8_t *)data, length));
+}}
 
-    for (size_t i = 0; i < length; ++value, ++i) {{
-        if (crc->input_reflected) {{
-            data_xor = {algorithm}_reverse_bits(*value, 8) & 0xFF;
-        }} else {{
-            data_xor = *value;
-        }}
+{algorithm_upper}_NUM_TYPE {algorithm}_calc_soft({algorithm_upper} *crc, void *data, size_t length) {{
+    (void)crc;
 
-        crc->accumulate = (crc->accumulate ^ (data_xor << (crc->width - 8))) & crc->cast_mask;
-        index = (uint8_t)((crc->accumulate >> (crc->width - 8)) & 0xFF);
-        crc->accumulate = (crc->accumulate << 8) & crc->cast_mask;
-        crc->accumulate ^= {algorithm}_table[index];
-    }}
+    return {algorithm}_finalize({algorithm}_update({algorithm_upper}_INIT_REGISTER, (const uint8_t *)data, length));
+}}
 
-    if (crc->result_reflected) {{
-        crc->accumulate = {algorithm}_reverse_bits(crc->accumulate, crc->width);
-    }}
+{algorithm_upper}_NUM_TYPE {algorithm}_accum({algorithm_upper} *crc, void *data, size_t length) {{
+    crc->accumulate = {algorithm}_update_accel(crc->accumulate, (const uint8_t *)data, length);
 
-    return crc->accumulate ^ crc->final_xor_value;
+    return {algorithm}_finalize(crc->accumulate);
 }}
 
 void {algorithm}_reset({algorithm_upper} *crc) {{
-    crc->accumulate = crc->initial_value;
+    crc->accumulate = {algorithm_upper}_INIT_REGISTER;
 }}
 
 {algorithm_upper}_NUM_TYPE {algorithm}_get({algorithm_upper} *crc) {{
@@ -145,5 +172,5 @@ void {algorithm}_reset({algorithm_upper} *crc) {{
     crc_val = crc->accumulate;
     // {algorithm}_reset(crc);
 
-    return crc_val ^ crc->final_xor_value;
+    return {algorithm}_finalize(crc_val);
 }}
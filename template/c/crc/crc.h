@@ -4,6 +4,7 @@
  * @param display_width: {display_width}
  * @param data_width: {data_width}
  * @param width: {width}
+ * @param engine: {engine}
  * 
  * Copyright (c) 2023-present SKB(skb666@qq.com)
  * Licensed under the Apache License, Version 2.0 (the "License");
@@ -37,6 +38,27 @@
 #define {algorithm_upper}_DEFAULT_DATA "{algorithm}.default"
 #define {algorithm_upper}_TABLE_DATA "{algorithm}.table"
 
+/* Model parameters as compile time constants. The register is kept reflected
+ * if the input is reflected, the initial value is given in that domain. A
+ * non-reflected register is left-aligned to whole bytes, by ALIGN bits. */
+#define {algorithm_upper}_WIDTH {width}
+#define {algorithm_upper}_REG_WIDTH {register_width}
+#define {algorithm_upper}_ALIGN {align}
+#define {algorithm_upper}_NUM_BITS {data_width}
+#define {algorithm_upper}_REFLECTED {reflected:d}
+#define {algorithm_upper}_FINAL_REFLECT {final_reflect:d}
+#define {algorithm_upper}_INIT_REGISTER 0x{init_register:0{display_width}X}u
+#define {algorithm_upper}_FINAL_XOR 0x{final_xor_value:0{display_width}X}u
+#define {algorithm_upper}_CAST_MASK 0x{register_mask:0{display_width}X}u
+
+/* Table engine: {engine} */
+#define {algorithm_upper}_SLICE_BY {slice_by}
+#define {algorithm_upper}_TABLE_BITS {table_bits}
+
+/* Hardware acceleration: {accel_backend} */
+#define {algorithm_upper}_ACCEL {accel:d}
+#define {algorithm_upper}_ACCEL_CODE "{algorithm}.accel"
+
 #ifdef __cplusplus
 extern "C" {{
 #endif
@@ -55,6 +77,8 @@ typedef struct {{
 
 void {algorithm}_init({algorithm_upper} *crc);
 {algorithm_upper}_NUM_TYPE {algorithm}_calc({algorithm_upper} *crc, void *data, size_t length);
+{algorithm_upper}_NUM_TYPE {algorithm}_calc_soft({algorithm_upper} *crc, void *data, size_t length);
+int {algorithm}_accel_available(void);
 {algorithm_upper}_NUM_TYPE {algorithm}_accum({algorithm_upper} *crc, void *data, size_t length);
 void {algorithm}_reset({algorithm_upper} *crc);
 {algorithm_upper}_NUM_TYPE {algorithm}_get({algorithm_upper} *crc);
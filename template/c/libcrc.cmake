@@ -70,13 +70,20 @@ macro(CRC_ALG_COLLECT crc_dir crc_alg_name crc_source crc_include)
 endmacro()
 
 if(LIBCRC_DIR)
-    CRC_ALG_COLLECT(${CMAKE_CURRENT_SOURCE_DIR}/${LIBCRC_DIR} crc_alg crc_src crc_inc)
+    set(LIBCRC_ROOT ${CMAKE_CURRENT_SOURCE_DIR}/${LIBCRC_DIR})
 else()
-    CRC_ALG_COLLECT(${CMAKE_CURRENT_SOURCE_DIR} crc_alg crc_src crc_inc)
+    set(LIBCRC_ROOT ${CMAKE_CURRENT_SOURCE_DIR})
 endif()
+CRC_ALG_COLLECT(${LIBCRC_ROOT} crc_alg crc_src crc_inc)
 
 add_library(crc_all INTERFACE)
 target_link_libraries(crc_all INTERFACE ${crc_alg})
 
 add_library(crc STATIC ${crc_src})
 target_include_directories(crc PUBLIC ${crc_inc})
+
+# 所有参数模型合并为单个源文件，相同的查表只保留一份，见 crc.py --c-combined
+if(EXISTS ${LIBCRC_ROOT}/libcrc.c)
+    add_library(crc_combined STATIC ${LIBCRC_ROOT}/libcrc.c)
+    target_include_directories(crc_combined PUBLIC ${LIBCRC_ROOT})
+endif()
@@ -20,9 +20,37 @@
 
 #include "{algorithm}.h"
 
+/* Compare the accelerated update with the table implementation on
+ * pseudo-random buffers of many lengths and alignments */
+static int cross_check(void) {{
+    static uint8_t buffer[1024 + 16];
+    {algorithm_upper} crc;
+    uint32_t seed = 0x12345678u;
+    int errors = 0;
+
+    for (size_t i = 0; i < sizeof(buffer); ++i) {{
+        seed = seed * 1103515245u + 12345u;
+        buffer[i] = (uint8_t)(seed >> 16);
+    }}
+
+    CRC({algorithm}, init)(&crc);
+    for (size_t length = 0; length <= 1024; length += (length < 300 ? 1 : 37)) {{
+        for (size_t offset = 0; offset < 16; offset += 5) {{
+            if (CRC({algorithm}, calc)(&crc, buffer + offset, length) !=
+                CRC({algorithm}, calc_soft)(&crc, buffer + offset, length)) {{
+                printf("cross check failed: length %u offset %u\n", (unsigned)length, (unsigned)offset);
+                ++errors;
+            }}
+        }}
+    }}
+
+    return errors;
+}}
+
 int main() {{
     {algorithm_upper} crc;
-    {algorithm_upper}_NUM_TYPE crc_val, crc1, crc2;
+    {algorithm_upper}_NUM_TYPE crc_val, crc1, crc2, check;
+    int errors;
 
     char *data[] = {{
         "hello ",
@@ -48,7 +76,13 @@ int main() {{
     crc2 = CRC({algorithm}, get)(&crc);
     printf("0x%0" {algorithm_upper}_NUM_WIDTH {algorithm_upper}_NUM_PRIx "\n", crc2);
 
-    if (crc1 == crc2) {{
+    check = CRC({algorithm}, calc)(&crc, "123456789", 9);
+    printf("check: 0x%0" {algorithm_upper}_NUM_WIDTH {algorithm_upper}_NUM_PRIx "\n", check);
+
+    errors = cross_check();
+    printf("accel: %d, cross check errors: %d\n", CRC({algorithm}, accel_available)(), errors);
+
+    if (crc1 == crc2 && check == 0x{check:0{display_width}X}u && errors == 0) {{
         printf("\nTest {algorithm} succeeded!!!\n\n");
         return 0;
     }} else {{